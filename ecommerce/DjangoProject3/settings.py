@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import datetime
+import os
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -54,6 +56,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'ecommerce.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -99,6 +102,67 @@ DATABASES = {
 }
 
 
+# Cache
+# Catalog payloads and facet counts are cached here. Point 'default' at a shared
+# backend (django.core.cache.backends.redis.RedisCache, memcached or a file based
+# cache) when running several processes so invalidations reach every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecommerce',
+    }
+}
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 300
+# Anonymous carts live only in the cache and expire after a week without changes.
+GUEST_CART_CACHE_ALIAS = 'default'
+GUEST_CART_TTL = 60 * 60 * 24 * 7
+# Responses to checkout and cancellation are replayed for
+# retries that repeat an Idempotency-Key header within IDEMPOTENCY_TTL seconds.
+# The lock timeout must exceed the slowest of those requests.
+IDEMPOTENCY_CACHE_ALIAS = 'default'
+IDEMPOTENCY_TTL = 60 * 60 * 24
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+IDEMPOTENCY_WAIT_TIMEOUT = 10
+# Seconds checkout holds stock for an unpaid order. Stripe sessions expire
+# STRIPE_SESSION_EXPIRY_MARGIN seconds earlier and must live at least 30
+# minutes, so keep the difference above that.
+STOCK_RESERVATION_TTL = 40 * 60
+STRIPE_SESSION_EXPIRY_MARGIN = 5 * 60
+# Checkout sessions are created from an outbox (see ecommerce/outbox.py) and
+# retried by `manage.py process_payment_outbox` until this many attempts.
+PAYMENT_OUTBOX_MAX_ATTEMPTS = 8
+# Signing secret of the /api/payments/webhook/ endpoint from the Stripe dashboard.
+# Events are stored on receipt and applied by a `manage.py run_jobs` worker;
+# `manage.py process_stripe_events` sweeps up any left pending.
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
+STRIPE_EVENT_MAX_ATTEMPTS = 8
+# Payment confirmation, refunds and emails run as jobs from
+# the database queue (ecommerce/jobs.py), worked by `manage.py run_jobs`.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'orders@example.com')
+# Order and tracking IDs (utils/generate_tracking.py) embed the environment
+# variable ID_GENERATOR_HOST, 0-1023, which must differ between every host or
+# container of a deployment. Startup fails without it unless DEBUG is on.
+
+# Read model behind the public lookup by tracking number; rewritten whenever an
+# order's status changes. Unknown numbers are remembered briefly.
+TRACKING_CACHE_ALIAS = 'default'
+TRACKING_CACHE_TIMEOUT = 60 * 60 * 24
+TRACKING_MISSING_CACHE_TIMEOUT = 60
+# All Stripe calls go through ecommerce/gateway.py: one pooled HTTP session,
+# per-operation timeouts in seconds, bounded retries of transient errors, and a
+# circuit breaker that fails fast after consecutive failures.
+STRIPE_POOL_SIZE = 10
+STRIPE_TIMEOUTS = {'create_checkout_session': 10, 'retrieve_payment_intent': 5, 'create_refund': 10}
+STRIPE_MAX_RETRIES = 2
+STRIPE_BREAKER_FAILURE_THRESHOLD = 5
+STRIPE_BREAKER_RESET_TIMEOUT = 30
+# Use the in-process fake Stripe (ecommerce/fake_stripe.py) for local runs and benchmarks.
+STRIPE_FAKE = False
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -146,10 +210,28 @@ REST_FRAMEWORK = {
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES' : ['rest_framework.permissions.IsAuthenticated'],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'ecommerce.pagination.CursorOptInPagination',
     'PAGE_SIZE': 10,
+    # Public tracking lookups are unauthenticated, so they are rate limited per client IP.
+    'DEFAULT_THROTTLE_RATES': {
+        'tracking': '120/min',
+    },
+    # orjson-backed when installed, stdlib json otherwise.
+    'DEFAULT_RENDERER_CLASSES': [
+        'ecommerce.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'ecommerce.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# Responses at least this large are compressed (brotli if installed, else gzip).
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_BROTLI_QUALITY = 5
+
 SIMPLE_JWT = {
     'AUTH_HEADER_TYPES':('Bearer',),
     'ACCESS_TOKEN_LIFETIME': datetime.timedelta(minutes=30),
@@ -162,4 +244,5 @@ STRIPE_PUBLIC_KEY = "pk_test_51QrvGK09SSKEzAza3r0JIoREbTby6skLHeLQUxuuJFm3VpK16G
 STRIPE_SECRET_KEY = "sk_test_51QrvGK09SSKEzAzaW3K5221U2GHDTjj9a2p0RbRN3baubLOgKUHItiee6jZjTiQgtGbMND8EDtkCGvzayu79FwjB00rWLykhIv"
 
 
-CORS_ALLOW_CREDENTIALS = True  # If you're using authentication cookies
\ No newline at end of file
+CORS_ALLOW_CREDENTIALS = True  # If you're using authentication cookies
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key", "x-guest-cart-token")
@@ -14,16 +14,32 @@ from rest_framework.permissions import AllowAny
 from .serializers import LoginSerializer, UserSerializer,ProfileSerializer
 from .models import User,Profile
 from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from ecommerce.guest_cart import get_guest_cart_token, merge_guest_cart
 
 class LoginAPIView(APIView):
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
-        serializer.is_valid()
+        if serializer.is_valid():
+            merge_guest_cart(User.objects.get(email=serializer.validated_data['email']),
+                             get_guest_cart_token(request))
 
             # token, created = Token.objects.get_or_create(user=user)
             # return Response({"token": token.key, "user": UserSerializer(user).data})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+class GuestCartTokenObtainPairView(TokenObtainPairView):
+    """``TokenObtainPairView`` that also merges the caller's guest cart into their account."""
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+        merge_guest_cart(serializer.user, get_guest_cart_token(request))
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
 class UserRegistration(CreateAPIView):
     serializer_class = UserSerializer
     queryset = User.objects.all()
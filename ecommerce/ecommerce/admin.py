@@ -1,10 +1,25 @@
 from django.contrib import admin
 from .models import Category,Subcategory,Product,Review,Order,OrderItem
 
+
+class SubcategoryAdmin(admin.ModelAdmin):
+    list_select_related = ['category']
+
+
+class ProductAdmin(admin.ModelAdmin):
+    list_select_related = ['category', 'subcategory']
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # Subcategory labels include the category name; avoid a query per option.
+        if db_field.name == "subcategory":
+            kwargs["queryset"] = Subcategory.objects.select_related("category")
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
 # Register your models here.
 admin.site.register(Category)
-admin.site.register(Subcategory)
-admin.site.register(Product)
+admin.site.register(Subcategory, SubcategoryAdmin)
+admin.site.register(Product, ProductAdmin)
 admin.site.register(Review)
 admin.site.register(Order)
-admin.site.register(OrderItem)
\ No newline at end of file
+admin.site.register(OrderItem)
@@ -1,6 +1,26 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+def check_id_generator_host():
+    """Order and tracking IDs are only unique if every host of a deployment has its own ID_GENERATOR_HOST."""
+    from utils.generate_tracking import configured_host
+    try:
+        host = configured_host()
+    except ValueError as e:
+        raise ImproperlyConfigured(str(e))
+    if host is None and not settings.DEBUG:
+        raise ImproperlyConfigured(
+            "Set ID_GENERATOR_HOST to a number from 0 to 1023 that no other host of this deployment uses."
+        )
 
 
 class EcommerceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ecommerce'
+
+    def ready(self):
+        import ecommerce.signals
+        import ecommerce.tasks
+        check_id_generator_host()
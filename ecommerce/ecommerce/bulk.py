@@ -0,0 +1,158 @@
+import codecs
+import csv
+import json
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Category, Product, Subcategory
+from .reservations import held_quantity, net_of_holds
+from .search import index_products
+from .serializers import ProductImportSerializer
+from .signals import invalidate_model_caches
+
+IMPORT_CHUNK_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FIELDS = ["sku", "name", "description", "price", "stock", "category", "subcategory"]
+UPSERT_FIELDS = ["name", "description", "price", "stock", "category", "subcategory", "updated_at"]
+
+
+def detect_format(filename, default="csv"):
+    if filename and filename.lower().endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    if filename and filename.lower().endswith(".csv"):
+        return "csv"
+    return default
+
+
+def iter_rows(stream, fmt):
+    """Yield ``(line_number, row)`` from a binary CSV or JSON-lines stream without reading it all."""
+    lines = codecs.iterdecode(stream, "utf-8")
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+def load_taxonomy():
+    """Name -> id lookups for every category and subcategory, loaded once per import."""
+    categories = {name.lower(): pk for pk, name in Category.objects.values_list("id", "name")}
+    subcategories = {
+        name.lower(): (pk, category_id)
+        for pk, name, category_id in Subcategory.objects.values_list("id", "name", "category_id")
+    }
+    return categories, subcategories
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+
+    def as_dict(self):
+        return {"created": self.created, "updated": self.updated, "failed": len(self.errors), "errors": self.errors}
+
+
+def _upsert_chunk(seller, rows, report):
+    skus = [row["sku"] for row in rows]
+    now = timezone.now()
+    with transaction.atomic():
+        existing = dict(Product.objects.filter(user=seller, sku__in=skus).values_list("sku", "id"))
+        # Imported stock is the count on hand; units held by unpaid orders stay out of it.
+        stocks = net_of_holds({existing[row["sku"]]: row["stock"] for row in rows if row["sku"] in existing})
+        products = [
+            Product(
+                user=seller,
+                sku=row["sku"],
+                name=row["name"],
+                description=row["description"],
+                price=row["price"],
+                stock=stocks[existing[row["sku"]]] if row["sku"] in existing else row["stock"],
+                category_id=row["category"],
+                subcategory_id=row["subcategory"],
+                updated_at=now,
+            )
+            for row in rows
+        ]
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=["user", "sku"],
+            update_fields=UPSERT_FIELDS,
+        )
+        product_ids = list(Product.objects.filter(user=seller, sku__in=skus).values_list("id", flat=True))
+        index_products(product_ids)
+    report.updated += len(existing)
+    report.created += len(rows) - len(existing)
+
+
+def import_products(seller, rows, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Validate and upsert ``(line_number, row)`` pairs for ``seller`` in chunks,
+    keyed on the seller SKU. Invalid rows are reported and skipped.
+    """
+    report = ImportReport()
+    context = {"taxonomy": load_taxonomy()}
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        valid = {}
+        for line_number, row in chunk:
+            if row is None:
+                report.errors.append({"line": line_number, "errors": {"row": ["Malformed row."]}})
+                continue
+            serializer = ProductImportSerializer(data=row, context=context)
+            if not serializer.is_valid():
+                report.errors.append({"line": line_number, "sku": row.get("sku"), "errors": serializer.errors})
+                continue
+            # A SKU repeated inside one chunk keeps its last occurrence, as a sequential import would.
+            valid[serializer.validated_data["sku"]] = serializer.validated_data
+        if valid:
+            _upsert_chunk(seller, list(valid.values()), report)
+    if report.created or report.updated:
+        invalidate_model_caches(Product)
+    return report
+
+
+def export_rows(seller):
+    """Yield the seller's catalog as dicts, streaming from a server-side cursor."""
+    queryset = (
+        Product.objects.filter(user=seller)
+        .order_by("id")
+        # Exported as the count on hand, so an export imported back changes nothing.
+        .annotate(on_hand=F("stock") + held_quantity())
+        .values_list("sku", "name", "description", "price", "on_hand", "category__name", "subcategory__name")
+    )
+    for values in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield dict(zip(EXPORT_FIELDS, values))
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def stream_export(seller, fmt):
+    """Yield encoded export lines for ``StreamingHttpResponse`` or a file."""
+    if fmt == "csv":
+        writer = csv.DictWriter(_Echo(), fieldnames=EXPORT_FIELDS)
+        yield writer.writeheader()
+        for row in export_rows(seller):
+            yield writer.writerow(row)
+        return
+    for row in export_rows(seller):
+        yield json.dumps(row, default=str) + "\n"
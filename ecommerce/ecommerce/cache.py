@@ -0,0 +1,96 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+PRODUCT_NAMESPACE = "catalog-products"
+CATEGORY_NAMESPACE = "catalog-categories"
+SUBCATEGORY_NAMESPACE = "catalog-subcategories"
+CATEGORY_TREE_NAMESPACE = "catalog-category-tree"
+SHIPPING_CARRIER_NAMESPACE = "catalog-shipping-carriers"
+COUPON_NAMESPACE = "catalog-coupons"
+
+
+def get_cache():
+    return caches[getattr(settings, "CATALOG_CACHE_ALIAS", "default")]
+
+
+def _version_key(namespace):
+    return f"{namespace}:version"
+
+
+def get_version(namespace):
+    cache = get_cache()
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        # Seed from the clock so an evicted counter never restarts at a version that still has entries.
+        cache.add(_version_key(namespace), int(time.time() * 1000), None)
+        version = cache.get(_version_key(namespace))
+    return version
+
+
+def bump_version(*namespaces):
+    cache = get_cache()
+    for namespace in namespaces:
+        try:
+            cache.incr(_version_key(namespace))
+        except ValueError:
+            cache.add(_version_key(namespace), int(time.time() * 1000), None)
+
+
+def make_key(namespace, *parts):
+    digest = hashlib.md5(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+    return f"{namespace}:{get_version(namespace)}:{digest}"
+
+
+def get_timeout(timeout=None):
+    return timeout if timeout is not None else getattr(settings, "CATALOG_CACHE_TIMEOUT", 300)
+
+
+def get_or_set(namespace, parts, compute, timeout=None):
+    """Return the cached value for ``parts`` in the current namespace version, computing it on a miss."""
+    cache = get_cache()
+    key = make_key(namespace, *parts)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, get_timeout(timeout))
+    return value
+
+
+class CachedResponseMixin:
+    """
+    Read-through cache for ``list`` and ``retrieve``. Payloads are keyed by
+    host, path and query string under ``cache_namespace``; saving or deleting
+    the underlying models bumps the namespace version (see ``signals.py``).
+    A view that computed a validator for the response (``ConditionalGetMixin``)
+    has it in the key too, so the body always matches the ETag sent with it.
+    """
+
+    cache_namespace = None
+    cache_timeout = None
+    cache_validator = None
+
+    def get_cache_parts(self, request):
+        return (request.get_host(), request.path, sorted(request.query_params.lists()), self.cache_validator)
+
+    def cached_response(self, request, render):
+        cache = get_cache()
+        key = make_key(self.cache_namespace, *self.get_cache_parts(request))
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = render()
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, get_timeout(self.cache_timeout))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs))
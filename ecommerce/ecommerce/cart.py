@@ -0,0 +1,103 @@
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import CartItem
+
+LINE_SUBTOTAL = ExpressionWrapper(F("product__price") * F("quantity"), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def cart_items(user):
+    """The user's cart lines with their product joined and the line subtotal computed in SQL."""
+    return (
+        CartItem.objects.filter(user=user)
+        .select_related("product")
+        .annotate(line_subtotal=LINE_SUBTOTAL)
+        .order_by("created_at", "id")
+    )
+
+
+def cart_summary(user):
+    """Line count, unit count and cart total in a single aggregate query."""
+    return CartItem.objects.filter(user=user).aggregate(
+        item_count=Count("id"),
+        total_quantity=Coalesce(Sum("quantity"), 0),
+        cart_total=Coalesce(Sum(LINE_SUBTOTAL), Decimal("0.00"), output_field=DecimalField(max_digits=12, decimal_places=2)),
+    )
+
+
+UPSERT_BATCH_SIZE = 500
+
+
+def add_quantities(user, quantities):
+    """
+    Add ``{product_id: quantity}`` to the user's cart with one
+    ``INSERT ... ON CONFLICT (user_id, product_id) DO UPDATE`` per batch,
+    incrementing lines that already exist. Works on PostgreSQL and SQLite.
+    """
+    qn = connection.ops.quote_name
+    table = qn(CartItem._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    items = list(quantities.items())
+    for start in range(0, len(items), UPSERT_BATCH_SIZE):
+        batch = items[start:start + UPSERT_BATCH_SIZE]
+        params = []
+        for product_id, quantity in batch:
+            params += [user.pk, product_id, quantity, now]
+        sql = (
+            f"INSERT INTO {table} ({qn('user_id')}, {qn('product_id')}, {qn('quantity')}, {qn('created_at')}) "
+            f"VALUES {', '.join(['(%s, %s, %s, %s)'] * len(batch))} "
+            f"ON CONFLICT ({qn('user_id')}, {qn('product_id')}) "
+            f"DO UPDATE SET {qn('quantity')} = {table}.{qn('quantity')} + EXCLUDED.{qn('quantity')}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+def set_quantities(user, quantities):
+    """Overwrite the quantity of each ``{product_id: quantity}`` line, creating missing ones."""
+    CartItem.objects.bulk_create(
+        [CartItem(user=user, product_id=product_id, quantity=quantity) for product_id, quantity in quantities.items()],
+        update_conflicts=True,
+        unique_fields=["user", "product"],
+        update_fields=["quantity"],
+        batch_size=UPSERT_BATCH_SIZE,
+    )
+
+
+def collapse_operations(operations):
+    """
+    Reduce an ordered list of ``add``/``set``/``remove`` operations to one net
+    effect per product: ``("add", n)`` relative to the stored quantity or
+    ``("set", n)`` absolute, where ``("set", 0)`` removes the line.
+    """
+    effects = {}
+    for operation in operations:
+        product_id, quantity = operation["product_id"], operation.get("quantity", 0)
+        kind, current = effects.get(product_id, ("add", 0))
+        if operation["op"] == "add":
+            effects[product_id] = (kind, current + quantity)
+        elif operation["op"] == "set":
+            effects[product_id] = ("set", quantity)
+        else:
+            effects[product_id] = ("set", 0)
+    return effects
+
+
+def apply_cart_operations(user, operations):
+    """Apply a validated batch atomically with at most three write statements."""
+    effects = collapse_operations(operations)
+    adds = {product_id: n for product_id, (kind, n) in effects.items() if kind == "add" and n}
+    sets = {product_id: n for product_id, (kind, n) in effects.items() if kind == "set" and n}
+    removes = [product_id for product_id, (kind, n) in effects.items() if kind == "set" and not n]
+    with transaction.atomic():
+        if adds:
+            add_quantities(user, adds)
+        if sets:
+            set_quantities(user, sets)
+        if removes:
+            CartItem.objects.filter(user=user, product_id__in=removes).delete()
+    return effects
@@ -0,0 +1,30 @@
+from django.db.models import Count
+
+from .cache import CATEGORY_TREE_NAMESPACE, get_or_set
+from .models import Category, Subcategory
+
+
+def build_category_tree():
+    """Categories with nested subcategories and product counts, in two queries."""
+    categories = Category.objects.annotate(product_count=Count("products")).order_by("name")
+    subcategories = (
+        Subcategory.objects.annotate(product_count=Count("products"))
+        .order_by("name")
+        .values("id", "name", "category_id", "product_count")
+    )
+    children = {}
+    for subcategory in subcategories:
+        children.setdefault(subcategory.pop("category_id"), []).append(subcategory)
+    return [
+        {
+            "id": category.id,
+            "name": category.name,
+            "product_count": category.product_count,
+            "subcategories": children.get(category.id, []),
+        }
+        for category in categories
+    ]
+
+
+def get_category_tree():
+    return get_or_set(CATEGORY_TREE_NAMESPACE, (), build_category_tree)
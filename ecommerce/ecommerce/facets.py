@@ -0,0 +1,125 @@
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.db.models import Count, Q
+
+from .cache import get_or_set
+
+# Cached counts are keyed by arbitrary facet selections and search terms, so a
+# change cannot be patched into the entries it affects; a product change that
+# moves any count invalidates the whole namespace instead.
+FACET_NAMESPACE = "catalog-facets"
+
+PRICE_BANDS = OrderedDict([
+    ("0-500", (0, 500)),
+    ("500-1000", (500, 1000)),
+    ("1000-5000", (1000, 5000)),
+    ("5000+", (5000, None)),
+])
+
+
+def _split(value):
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+
+def _ids(value):
+    return sorted({int(part) for part in _split(value) if part.isdigit()})
+
+
+def parse_facet_params(params):
+    """Read the selected facet values from the query string, dropping anything unknown."""
+    in_stock = params.get("in_stock")
+    return {
+        "category": _ids(params.get("category")),
+        "subcategory": _ids(params.get("subcategory")),
+        "price_band": [band for band in _split(params.get("price_band")) if band in PRICE_BANDS],
+        "in_stock": in_stock.lower() in ("1", "true", "yes") if in_stock else None,
+    }
+
+
+# Product fields the counts depend on, including the text a search narrows them by.
+FACET_FIELDS = ("category_id", "subcategory_id", "price", "stock", "name", "description")
+
+
+def price_band(price):
+    for band, (low, high) in PRICE_BANDS.items():
+        if price >= low and (high is None or price < high):
+            return band
+    return None
+
+
+def facet_state(category_id, subcategory_id, price, stock, name, description):
+    """What one product contributes to the facet counts, from its ``FACET_FIELDS``."""
+    return category_id, subcategory_id, price_band(Decimal(price)), stock > 0, name, description
+
+
+def price_band_q(band):
+    low, high = PRICE_BANDS[band]
+    q = Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def apply_facets(queryset, selected, exclude=None):
+    """Filter ``queryset`` by every selected facet except ``exclude``."""
+    if selected["category"] and exclude != "category":
+        queryset = queryset.filter(category_id__in=selected["category"])
+    if selected["subcategory"] and exclude != "subcategory":
+        queryset = queryset.filter(subcategory_id__in=selected["subcategory"])
+    if selected["price_band"] and exclude != "price_band":
+        q = Q()
+        for band in selected["price_band"]:
+            q |= price_band_q(band)
+        queryset = queryset.filter(q)
+    if selected["in_stock"] is not None and exclude != "in_stock":
+        queryset = queryset.filter(stock__gt=0) if selected["in_stock"] else queryset.filter(stock=0)
+    return queryset
+
+
+def compute_facet_counts(queryset, selected):
+    """
+    Count each facet against the result set filtered by all *other* facets, so
+    selecting one category still shows how many products the siblings hold.
+    """
+    queryset = queryset.order_by()
+    categories = (
+        apply_facets(queryset, selected, exclude="category")
+        .values("category_id", "category__name")
+        .annotate(count=Count("id"))
+        .order_by("category__name")
+    )
+    subcategories = (
+        apply_facets(queryset, selected, exclude="subcategory")
+        .values("subcategory_id", "subcategory__name", "category_id")
+        .annotate(count=Count("id"))
+        .order_by("subcategory__name")
+    )
+    bands = apply_facets(queryset, selected, exclude="price_band").aggregate(
+        **{band: Count("id", filter=price_band_q(band)) for band in PRICE_BANDS}
+    )
+    stock = apply_facets(queryset, selected, exclude="in_stock").aggregate(
+        in_stock=Count("id", filter=Q(stock__gt=0)),
+        out_of_stock=Count("id", filter=Q(stock=0)),
+    )
+    return {
+        "category": [
+            {"id": row["category_id"], "name": row["category__name"], "count": row["count"]}
+            for row in categories
+        ],
+        "subcategory": [
+            {"id": row["subcategory_id"], "name": row["subcategory__name"],
+             "category": row["category_id"], "count": row["count"]}
+            for row in subcategories
+        ],
+        "price_band": [{"band": band, "count": bands[band]} for band in PRICE_BANDS],
+        "in_stock": stock,
+    }
+
+
+def get_facet_counts(queryset, selected, search_terms=()):
+    return get_or_set(
+        FACET_NAMESPACE,
+        (selected, list(search_terms)),
+        lambda: compute_facet_counts(queryset, selected),
+    )
@@ -0,0 +1,98 @@
+import random
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+import stripe
+
+# Shared by every fake resource: seconds each call sleeps to simulate the
+# network round trip, and the fraction of calls that fail with a connection error.
+latency = 0.0
+failure_rate = 0.0
+
+
+def _simulate():
+    time.sleep(latency)
+    if failure_rate and random.random() < failure_rate:
+        raise stripe.error.APIConnectionError("Simulated Stripe outage")
+
+
+def _replay(stored, idempotency_key, params):
+    # As Stripe does: a repeated key returns the first result, but only for identical parameters.
+    original, result = stored
+    if original != params:
+        raise stripe.error.IdempotencyError(
+            f"Keys for idempotent requests can only be used with the same parameters they were first used with. "
+            f"Try using a key other than '{idempotency_key}' if you meant to execute a different request."
+        )
+    return result
+
+
+class CheckoutSession:
+    """
+    In-process stand-in for ``stripe.checkout.Session`` used when
+    ``STRIPE_FAKE`` is on. Sessions are kept in memory and reported as paid.
+    """
+
+    _sessions = {}
+    _idempotent = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def create(cls, idempotency_key=None, **params):
+        _simulate()
+        with cls._lock:
+            if idempotency_key in cls._idempotent:
+                return _replay(cls._idempotent[idempotency_key], idempotency_key, params)
+            session_id = f"cs_fake_{uuid.uuid4().hex}"
+            session = SimpleNamespace(
+                id=session_id,
+                url=f"https://checkout.stripe.test/pay/{session_id}",
+                payment_status="paid",
+                payment_intent=f"pi_fake_{uuid.uuid4().hex}",
+                metadata=params.get("metadata") or {},
+                expires_at=params.get("expires_at"),
+            )
+            cls._sessions[session_id] = session
+            if idempotency_key:
+                cls._idempotent[idempotency_key] = (params, session)
+            return session
+
+    @classmethod
+    def retrieve(cls, session_id):
+        _simulate()
+        return cls._sessions[session_id]
+
+
+class PaymentIntent:
+    @classmethod
+    def retrieve(cls, payment_intent_id):
+        _simulate()
+        return SimpleNamespace(id=payment_intent_id, status="succeeded")
+
+
+class Refund:
+    _idempotent = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def create(cls, idempotency_key=None, **params):
+        _simulate()
+        with cls._lock:
+            if idempotency_key in cls._idempotent:
+                return _replay(cls._idempotent[idempotency_key], idempotency_key, params)
+            refund = SimpleNamespace(id=f"re_fake_{uuid.uuid4().hex}", status="succeeded",
+                                     payment_intent=params.get("payment_intent"))
+            if idempotency_key:
+                cls._idempotent[idempotency_key] = (params, refund)
+            return refund
+
+
+def reset():
+    """Forget every fake session and idempotency key, as a fresh Stripe test account would."""
+    with CheckoutSession._lock:
+        CheckoutSession._sessions.clear()
+        CheckoutSession._idempotent.clear()
+    with Refund._lock:
+        Refund._idempotent.clear()
@@ -0,0 +1,21 @@
+from rest_framework import filters
+
+from .facets import apply_facets, parse_facet_params
+from .search import get_search_backend
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """Keeps the ``?search=`` contract but answers it from the product search index."""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return get_search_backend().search(queryset, terms)
+
+
+class ProductFacetFilter(filters.BaseFilterBackend):
+    """Filters products by ``category``, ``subcategory``, ``price_band`` and ``in_stock``."""
+
+    def filter_queryset(self, request, queryset, view):
+        return apply_facets(queryset, parse_facet_params(request.query_params))
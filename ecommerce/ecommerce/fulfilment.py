@@ -0,0 +1,84 @@
+from django.db import transaction
+from django.utils import timezone
+
+from utils.generate_tracking import generate_custom_ids
+
+from .models import Order
+from .reservations import release_order_reservations
+from .tasks import refund_order
+from .tracking import refresh as refresh_tracking
+
+# Allowed moves between Order.STATUS_CHOICES. Payment confirmation moves
+# pending orders to processing; everything after that is fulfilment.
+TRANSITIONS = {
+    "pending": {"processing", "cancelled"},
+    "processing": {"shipped", "cancelled"},
+    "shipped": {"delivered"},
+    "delivered": set(),
+    "cancelled": set(),
+}
+CANCELLABLE_STATUSES = [current for current, targets in TRANSITIONS.items() if "cancelled" in targets]
+# Orders locked and updated per transaction.
+CHUNK_SIZE = 1000
+
+
+def can_transition(current, target):
+    return target in TRANSITIONS.get(current, ())
+
+
+def transition_orders(order_ids, target):
+    """
+    Move ``order_ids`` to ``target`` where the state machine allows it.
+    Each chunk is locked, checked and updated with set-based queries;
+    orders becoming shipped get tracking numbers generated for the whole
+    chunk, and cancelled orders are refunded by a job or have their stock
+    released. Cached tracking records are rewritten once each chunk
+    commits. Returns one result dict per requested id, in request order.
+    """
+    if target not in TRANSITIONS:
+        raise ValueError(f"Unknown order status {target!r}")
+    order_ids = list(dict.fromkeys(order_ids))
+    results = {}
+    for start in range(0, len(order_ids), CHUNK_SIZE):
+        results.update(_transition_chunk(order_ids[start:start + CHUNK_SIZE], target))
+    return [results[pk] for pk in order_ids]
+
+
+def _transition_chunk(order_ids, target):
+    results = {pk: {"id": pk, "ok": False, "error": "Order not found."} for pk in order_ids}
+    with transaction.atomic():
+        rows = (
+            Order.objects.select_for_update()
+            .filter(pk__in=order_ids)
+            .values_list("pk", "status", "payment_status", "tracking_number")
+        )
+        movable = []
+        for pk, current, payment_status, tracking_number in rows:
+            if not can_transition(current, target):
+                results[pk] = {"id": pk, "ok": False, "status": current,
+                               "error": f"Cannot move an order from {current} to {target}."}
+                continue
+            movable.append((pk, payment_status, tracking_number))
+            results[pk] = {"id": pk, "ok": True, "previous_status": current, "status": target}
+        if not movable:
+            return results
+
+        now = timezone.now()
+        if target == "shipped":
+            numbers = iter(generate_custom_ids(sum(1 for _, _, tracking in movable if not tracking)))
+            orders = [Order(pk=pk, status=target, updated_at=now, tracking_number=tracking or next(numbers))
+                      for pk, _, tracking in movable]
+            Order.objects.bulk_update(orders, ["status", "updated_at", "tracking_number"], batch_size=500)
+            for order in orders:
+                results[order.pk]["tracking_number"] = order.tracking_number
+        else:
+            Order.objects.filter(pk__in=[pk for pk, _, _ in movable]).update(status=target, updated_at=now)
+        refresh_tracking(pk for pk, _, _ in movable)
+
+        if target == "cancelled":
+            paid = [pk for pk, payment_status, _ in movable if payment_status == "paid"]
+            refund_order.enqueue_many([{"order_id": pk} for pk in paid])
+            unpaid = [pk for pk, payment_status, _ in movable if payment_status != "paid"]
+    if target == "cancelled":
+        release_order_reservations(unpaid)
+    return results
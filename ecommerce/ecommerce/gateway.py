@@ -0,0 +1,266 @@
+import math
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+import stripe
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+
+from . import fake_stripe
+
+# Transient failures: retried, and counted by the circuit breaker. Anything
+# else (card declined, bad request, auth) is the caller's problem.
+RETRYABLE_ERRORS = (stripe.error.APIConnectionError, stripe.error.RateLimitError, stripe.error.APIError)
+DEFAULT_TIMEOUTS = {
+    "create_checkout_session": 10,
+    "retrieve_checkout_session": 5,
+    "retrieve_payment_intent": 5,
+    "create_refund": 10,
+}
+LATENCY_SAMPLES = 1000
+
+
+class CircuitOpen(stripe.error.APIConnectionError):
+    """Raised without calling Stripe while the breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive transient failures and
+    fails fast for ``reset_timeout`` seconds; then lets a single trial call
+    through, closing again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations = {}
+
+    def _operation(self, name):
+        return self.operations.setdefault(name, {
+            "calls": 0, "errors": 0, "retries": 0, "short_circuited": 0, "latencies": deque(maxlen=LATENCY_SAMPLES),
+        })
+
+    def record(self, name, latency=None, error=False, retry=False, short_circuited=False):
+        with self.lock:
+            operation = self._operation(name)
+            if latency is not None:
+                operation["calls"] += 1
+                operation["latencies"].append(latency)
+            operation["errors"] += error
+            operation["retries"] += retry
+            operation["short_circuited"] += short_circuited
+
+    def snapshot(self):
+        with self.lock:
+            result = {}
+            for name, operation in self.operations.items():
+                latencies = sorted(operation["latencies"])
+                result[name] = {key: value for key, value in operation.items() if key != "latencies"}
+                if latencies:
+                    result[name].update({
+                        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+                        "p95_ms": round(latencies[math.ceil(len(latencies) * 0.95) - 1] * 1000, 1),
+                        "max_ms": round(latencies[-1] * 1000, 1),
+                    })
+            return result
+
+
+class StripeBackend:
+    """Stripe over one pooled ``requests`` session, shared by a client per timeout."""
+
+    def __init__(self, api_key, pool_size=10):
+        self.api_key = api_key
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def client(self, timeout):
+        with self.lock:
+            if timeout not in self.clients:
+                client = stripe.StripeClient(
+                    self.api_key,
+                    http_client=stripe.RequestsClient(timeout=timeout, session=self.session),
+                    # Retries are the gateway's job, so the breaker sees every failure.
+                    max_network_retries=0,
+                )
+                self.clients[timeout] = getattr(client, "v1", client)
+            return self.clients[timeout]
+
+    def create_checkout_session(self, timeout, idempotency_key=None, **params):
+        options = {"idempotency_key": idempotency_key} if idempotency_key else None
+        return self.client(timeout).checkout.sessions.create(params=params, options=options)
+
+    def retrieve_checkout_session(self, timeout, session_id):
+        return self.client(timeout).checkout.sessions.retrieve(session_id)
+
+    def retrieve_payment_intent(self, timeout, payment_intent_id):
+        return self.client(timeout).payment_intents.retrieve(payment_intent_id)
+
+    def create_refund(self, timeout, idempotency_key=None, **params):
+        options = {"idempotency_key": idempotency_key} if idempotency_key else None
+        return self.client(timeout).refunds.create(params=params, options=options)
+
+
+class FakeBackend:
+    """The in-process fake from ``fake_stripe``; timeouts are ignored."""
+
+    def create_checkout_session(self, timeout, idempotency_key=None, **params):
+        return fake_stripe.CheckoutSession.create(idempotency_key=idempotency_key, **params)
+
+    def retrieve_checkout_session(self, timeout, session_id):
+        return fake_stripe.CheckoutSession.retrieve(session_id)
+
+    def retrieve_payment_intent(self, timeout, payment_intent_id):
+        return fake_stripe.PaymentIntent.retrieve(payment_intent_id)
+
+    def create_refund(self, timeout, idempotency_key=None, **params):
+        return fake_stripe.Refund.create(idempotency_key=idempotency_key, **params)
+
+
+class PaymentGateway:
+    """
+    The one way the project talks to Stripe. Every call gets its own
+    timeout, up to ``max_retries`` retries of transient failures with
+    jittered exponential backoff, and goes through a circuit breaker that
+    raises ``CircuitOpen`` instead of calling a degraded Stripe. Writes that
+    may be retried must pass an ``idempotency_key``.
+    """
+
+    def __init__(self, backend, timeouts=None, max_retries=2, backoff=0.2, breaker=None):
+        self.backend = backend
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = Metrics()
+
+    def _call(self, operation, *args, **kwargs):
+        method = getattr(self.backend, operation)
+        timeout = self.timeouts[operation]
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                self.metrics.record(operation, short_circuited=True)
+                raise CircuitOpen("Stripe is unavailable; the circuit breaker is open.")
+            started = time.perf_counter()
+            try:
+                result = method(timeout, *args, **kwargs)
+            except RETRYABLE_ERRORS:
+                self.metrics.record(operation, time.perf_counter() - started, error=True)
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                self.metrics.record(operation, retry=True)
+                time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1))
+            except stripe.error.StripeError:
+                # Stripe answered, so it is healthy even though the request was refused.
+                self.metrics.record(operation, time.perf_counter() - started, error=True)
+                self.breaker.record_success()
+                raise
+            else:
+                self.metrics.record(operation, time.perf_counter() - started)
+                self.breaker.record_success()
+                return result
+
+    def create_checkout_session(self, idempotency_key=None, **params):
+        return self._call("create_checkout_session", idempotency_key=idempotency_key, **params)
+
+    def retrieve_checkout_session(self, session_id):
+        return self._call("retrieve_checkout_session", session_id)
+
+    def retrieve_payment_intent(self, payment_intent_id):
+        return self._call("retrieve_payment_intent", payment_intent_id)
+
+    def create_refund(self, payment_intent, idempotency_key=None):
+        return self._call("create_refund", idempotency_key=idempotency_key, payment_intent=payment_intent)
+
+    def stats(self):
+        return {"breaker": self.breaker.state, "operations": self.metrics.snapshot()}
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def build_gateway():
+    if getattr(settings, "STRIPE_FAKE", False):
+        backend = FakeBackend()
+    else:
+        backend = StripeBackend(settings.STRIPE_SECRET_KEY, pool_size=getattr(settings, "STRIPE_POOL_SIZE", 10))
+    return PaymentGateway(
+        backend,
+        timeouts=getattr(settings, "STRIPE_TIMEOUTS", None),
+        max_retries=getattr(settings, "STRIPE_MAX_RETRIES", 2),
+        breaker=CircuitBreaker(
+            failure_threshold=getattr(settings, "STRIPE_BREAKER_FAILURE_THRESHOLD", 5),
+            reset_timeout=getattr(settings, "STRIPE_BREAKER_RESET_TIMEOUT", 30),
+        ),
+    )
+
+
+def get_gateway():
+    """The process-wide gateway, built from settings on first use."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = build_gateway()
+    return _gateway
+
+
+def set_gateway(gateway):
+    """Swap the process-wide gateway, e.g. for a fake in tests; ``None`` rebuilds it from settings."""
+    global _gateway
+    _gateway = gateway
+
+
+@receiver(setting_changed)
+def reset_gateway(setting, **kwargs):
+    if setting.startswith("STRIPE_"):
+        set_gateway(None)
@@ -0,0 +1,91 @@
+import re
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .cart import add_quantities
+from .models import Product
+
+GUEST_CART_HEADER = "HTTP_X_GUEST_CART_TOKEN"
+GUEST_CART_FIELD = "guest_cart_token"
+TOKEN_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def get_cache():
+    return caches[getattr(settings, "GUEST_CART_CACHE_ALIAS", "default")]
+
+
+def get_ttl():
+    return getattr(settings, "GUEST_CART_TTL", 60 * 60 * 24 * 7)
+
+
+def _key(token):
+    return f"guest-cart:{token}"
+
+
+def new_token():
+    return uuid.uuid4().hex
+
+
+def get_guest_cart_token(request):
+    """The guest cart token from the ``X-Guest-Cart-Token`` header or the request body, if well formed."""
+    token = request.META.get(GUEST_CART_HEADER)
+    if not token and hasattr(request.data, "get"):
+        token = request.data.get(GUEST_CART_FIELD)
+    if isinstance(token, str) and TOKEN_RE.match(token):
+        return token
+    return None
+
+
+def load(token):
+    """``{product_id: quantity}`` for the guest cart; empty when missing or expired."""
+    return get_cache().get(_key(token)) or {}
+
+
+def save(token, items):
+    if items:
+        # Every write restarts the TTL, so an active guest never loses their cart.
+        get_cache().set(_key(token), items, get_ttl())
+    else:
+        get_cache().delete(_key(token))
+
+
+def add_item(token, product_id, quantity):
+    items = load(token)
+    items[product_id] = items.get(product_id, 0) + quantity
+    save(token, items)
+    return items
+
+
+def set_item(token, product_id, quantity):
+    items = load(token)
+    if quantity > 0:
+        items[product_id] = quantity
+    else:
+        items.pop(product_id, None)
+    save(token, items)
+    return items
+
+
+def clear(token):
+    get_cache().delete(_key(token))
+
+
+def merge_guest_cart(user, token):
+    """
+    Fold a guest cart into the user's persistent cart and drop it from the
+    cache. Quantities for products already in the cart are added together.
+    Returns the number of merged lines.
+    """
+    if not token:
+        return 0
+    items = load(token)
+    if not items:
+        return 0
+    product_ids = set(Product.objects.filter(pk__in=items).values_list("pk", flat=True))
+    items = {product_id: quantity for product_id, quantity in items.items()
+             if product_id in product_ids and quantity > 0}
+    add_quantities(user, items)
+    clear(token)
+    return len(items)
@@ -0,0 +1,105 @@
+import functools
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = "HTTP_IDEMPOTENCY_KEY"
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+
+
+def get_cache():
+    return caches[getattr(settings, "IDEMPOTENCY_CACHE_ALIAS", "default")]
+
+
+def get_ttl():
+    return getattr(settings, "IDEMPOTENCY_TTL", 60 * 60 * 24)
+
+
+def get_lock_timeout():
+    return getattr(settings, "IDEMPOTENCY_LOCK_TIMEOUT", 60)
+
+
+def get_wait_timeout():
+    return getattr(settings, "IDEMPOTENCY_WAIT_TIMEOUT", 10)
+
+
+def _fingerprint(request):
+    parts = [request.method, request.path, sorted(request.query_params.lists()), request.data]
+    return hashlib.md5(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _mismatch():
+    return Response({"error": "Idempotency-Key was already used for a different request"},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+
+def _replay(stored, fingerprint):
+    if stored["fingerprint"] != fingerprint:
+        return _mismatch()
+    response = Response(stored["data"], status=stored["status"])
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(handler):
+    """
+    Make a view handler safe to retry with an ``Idempotency-Key`` header.
+
+    The first response per (user, key) is kept for ``IDEMPOTENCY_TTL`` and
+    replayed for retries of the same request; reusing a key for a different
+    request is a 422. A duplicate that arrives while the first is still
+    running waits for its response instead of repeating the work. Server
+    errors and 409 conflicts are not stored, so those can be retried for real.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.META.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return handler(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({"error": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        cache = get_cache()
+        digest = hashlib.md5(key.encode()).hexdigest()
+        response_key = f"idempotency:{request.user.pk}:{digest}"
+        lock_key = f"{response_key}:lock"
+        fingerprint = _fingerprint(request)
+
+        deadline = time.monotonic() + get_wait_timeout()
+        while True:
+            stored = cache.get(response_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+            # The lock expires on its own, so a crashed worker cannot wedge the key.
+            if cache.add(lock_key, fingerprint, get_lock_timeout()):
+                break
+            in_flight = cache.get(lock_key)
+            if in_flight is not None and in_flight != fingerprint:
+                return _mismatch()
+            if time.monotonic() >= deadline:
+                return Response({"error": "A request with this Idempotency-Key is still in progress"},
+                                status=status.HTTP_409_CONFLICT)
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            # The first request may have finished between the read and taking the lock.
+            stored = cache.get(response_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+            response = handler(self, request, *args, **kwargs)
+            # A conflict reports a race the retry may no longer hit.
+            if response.status_code < 500 and response.status_code != status.HTTP_409_CONFLICT:
+                cache.set(response_key, {"fingerprint": fingerprint, "status": response.status_code,
+                                         "data": response.data}, get_ttl())
+            return response
+        finally:
+            cache.delete(lock_key)
+
+    return wrapper
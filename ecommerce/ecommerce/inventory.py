@@ -0,0 +1,66 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Product
+from .reservations import net_of_holds
+from .serializers import InventoryItemSerializer
+from .signals import invalidate_model_caches
+
+INVENTORY_SYNC_MAX_ITEMS = 10000
+INVENTORY_BATCH_SIZE = 1000
+
+
+def sync_inventory(items, queryset):
+    """
+    Apply a batch of ``{id, stock, price}`` changes to products visible in
+    ``queryset``; ``stock`` is the count on hand, stored less any units held
+    by unpaid orders. Items for the same id are merged field by field, so an item
+    is only superseded by later items that set the same fields. Rows sharing
+    the same set of changed columns are written with one ``bulk_update`` (a
+    single ``UPDATE ... CASE`` per 1000 rows), all inside one transaction.
+    Returns one result per input item, in input order.
+    """
+    results = [None] * len(items)
+    changes = {}
+    mentions = {}
+    for index, item in enumerate(items):
+        serializer = InventoryItemSerializer(data=item)
+        if serializer.is_valid():
+            data = serializer.validated_data
+            fields = changes.setdefault(data["id"], {})
+            for field in ("stock", "price"):
+                if field in data:
+                    # A later value for the same field wins, as it would over sequential requests.
+                    fields[field] = (index, data[field])
+            mentions.setdefault(data["id"], []).append(index)
+        else:
+            results[index] = {"id": item.get("id") if isinstance(item, dict) else None,
+                              "status": "invalid", "errors": serializer.errors}
+
+    now = timezone.now()
+    with transaction.atomic():
+        found = set(queryset.filter(pk__in=changes).values_list("pk", flat=True))
+        stocks = net_of_holds({pk: changes[pk]["stock"][1] for pk in found if "stock" in changes[pk]})
+        groups = {}
+        for product_id, fields in changes.items():
+            if product_id not in found:
+                for index in mentions[product_id]:
+                    results[index] = {"id": product_id, "status": "not_found"}
+                continue
+            names = tuple(field for field in ("stock", "price") if field in fields)
+            values = {field: fields[field][1] for field in names}
+            if "stock" in values:
+                values["stock"] = stocks[product_id]
+            groups.setdefault(names, []).append(Product(pk=product_id, updated_at=now, **values))
+            for index, _ in fields.values():
+                results[index] = {"id": product_id, "status": "updated"}
+        for fields, products in groups.items():
+            Product.objects.bulk_update(products, list(fields) + ["updated_at"], batch_size=INVENTORY_BATCH_SIZE)
+        if groups:
+            invalidate_model_caches(Product)
+
+    for index, result in enumerate(results):
+        if result is None:
+            # Every field it set was set again by a later item for the same id.
+            results[index] = {"id": items[index].get("id"), "status": "superseded"}
+    return results
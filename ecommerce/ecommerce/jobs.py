@@ -0,0 +1,152 @@
+import inspect
+import logging
+import os
+import random
+import socket
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+BASE_BACKOFF_SECONDS = 5
+MAX_BACKOFF_SECONDS = 3600
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+class Task:
+    """A function registered with ``@task``; call it directly or ``enqueue`` it for a worker."""
+
+    def __init__(self, func, name, max_attempts, timeout):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.signature = inspect.signature(func)
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    def enqueue(self, run_at=None, **kwargs):
+        """
+        Queue a run with ``kwargs``, which must match the task's signature and
+        be JSON serialisable. Call inside the transaction that makes the work
+        necessary so the job exists exactly when the change does.
+        """
+        # Bad arguments fail here, in the caller, rather than later in a worker.
+        self.signature.bind(**kwargs)
+        return Job.objects.create(task=self.name, payload=kwargs, max_attempts=self.max_attempts,
+                                  run_at=run_at or timezone.now())
+
+    def enqueue_many(self, kwargs_list, run_at=None):
+        """``enqueue`` for a batch, in one insert."""
+        run_at = run_at or timezone.now()
+        for kwargs in kwargs_list:
+            self.signature.bind(**kwargs)
+        return Job.objects.bulk_create([
+            Job(task=self.name, payload=kwargs, max_attempts=self.max_attempts, run_at=run_at)
+            for kwargs in kwargs_list
+        ])
+
+
+def task(name=None, max_attempts=5, timeout=60):
+    """
+    Register a function as a background task. ``timeout`` is the visibility
+    timeout: a claimed job not finished within it is handed to another worker.
+    """
+    def decorator(func):
+        registered = Task(func, name or f"{func.__module__}.{func.__name__}", max_attempts, timeout)
+        TASKS[registered.name] = registered
+        return registered
+    return decorator
+
+
+def backoff(attempts):
+    delay = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim(worker, limit=10):
+    """
+    Lock up to ``limit`` due jobs for ``worker``: queued jobs whose time has
+    come, and running jobs whose visibility timeout lapsed (their worker
+    died). Rows another worker is claiming are skipped, not waited on.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=QUEUED, run_at__lte=now) | Q(status=RUNNING, locked_until__lte=now))
+            .order_by("run_at", "id")[:limit]
+        )
+        claimed = []
+        for job in jobs:
+            if job.status == RUNNING and job.attempts >= job.max_attempts:
+                job.status, job.finished_at = FAILED, now
+                job.last_error = job.last_error or "Visibility timeout expired on the last attempt."
+                job.locked_until, job.locked_by = None, ""
+                continue
+            registered = TASKS.get(job.task)
+            job.status = RUNNING
+            job.attempts += 1
+            job.locked_by = worker
+            job.locked_until = now + timedelta(seconds=registered.timeout if registered else 60)
+            claimed.append(job)
+        Job.objects.bulk_update(jobs, ["status", "attempts", "locked_by", "locked_until", "last_error", "finished_at"])
+    return claimed
+
+
+def run_job(job):
+    """Run one claimed job and record the outcome. Returns whether it succeeded."""
+    registered = TASKS.get(job.task)
+    # Only the claim that is still current may record a result.
+    current = Job.objects.filter(pk=job.pk, status=RUNNING, attempts=job.attempts, locked_by=job.locked_by)
+    try:
+        if registered is None:
+            raise LookupError(f"Unknown task {job.task}")
+        registered.func(**job.payload)
+    except Exception as e:
+        logger.exception("Job %s (%s) failed on attempt %s", job.pk, job.task, job.attempts)
+        now = timezone.now()
+        if registered is None or job.attempts >= job.max_attempts:
+            current.update(status=FAILED, last_error=str(e), locked_until=None, locked_by="", finished_at=now)
+        else:
+            current.update(status=QUEUED, last_error=str(e), locked_until=None, locked_by="",
+                           run_at=now + backoff(job.attempts))
+        return False
+    current.update(status=DONE, last_error="", locked_until=None, locked_by="", finished_at=timezone.now())
+    return True
+
+
+def work(worker=None, batch=10, idle_sleep=1.0, drain=False, stop=None):
+    """
+    Claim and run jobs until ``stop`` (an ``Event``) is set, or, with
+    ``drain``, until nothing is due. Returns how many jobs were run.
+    """
+    worker = worker or worker_name()
+    ran = 0
+    while stop is None or not stop.is_set():
+        jobs = claim(worker, batch)
+        for job in jobs:
+            run_job(job)
+            ran += 1
+        if not jobs:
+            if drain:
+                break
+            time.sleep(idle_sleep)
+    return ran
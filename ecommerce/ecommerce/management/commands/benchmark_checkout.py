@@ -0,0 +1,102 @@
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from accounts.models import User
+from ecommerce import fake_stripe
+from ecommerce.models import CartItem, Category, Product, ShippingAddress, ShippingCarrier, Subcategory
+from ecommerce.views import CheckoutAPIView
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure checkout throughput against the fake Stripe with simulated latency. "
+        "--legacy wraps each checkout in one transaction, as it was before the outbox."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checkouts", type=int, default=200)
+        parser.add_argument("--workers", type=int, default=16)
+        parser.add_argument("--latency", type=float, default=0.2, help="Simulated Stripe round trip in seconds.")
+        parser.add_argument("--legacy", action="store_true")
+
+    def setup(self, tag, checkouts):
+        seller = User.objects.create_user(email=f"bench-{tag}@example.com", first_name="Bench", last_name="Seller",
+                                          role="seller")
+        category = Category.objects.create(name=f"bench-{tag}")
+        subcategory = Subcategory.objects.create(name=f"bench-{tag}", category=category)
+        # Every buyer checks out the same product, the flash-sale case.
+        product = Product.objects.create(user=seller, name=f"bench-{tag}", description="", price=100,
+                                         stock=checkouts, category=category, subcategory=subcategory)
+        carrier = ShippingCarrier.objects.create(name=f"bench-{tag}", price=0, delivery_time="1 day")
+        buyers = User.objects.bulk_create(
+            User(email=f"bench-{tag}-{i}@example.com", first_name="Bench", last_name="Buyer", role="buyer")
+            for i in range(checkouts)
+        )
+        addresses = ShippingAddress.objects.bulk_create(
+            ShippingAddress(user=buyer, full_name="Bench Buyer", address_line1="1 Main St", city="City",
+                            state="State", country="IN", postal_code="000000", phone_number="0000000000")
+            for buyer in buyers
+        )
+        CartItem.objects.bulk_create(CartItem(user=buyer, product=product, quantity=1) for buyer in buyers)
+        return category, carrier, [(buyer, address.pk) for buyer, address in zip(buyers, addresses)]
+
+    def checkout(self, view, factory, buyer, address_id, carrier_id, legacy, start):
+        start.wait()
+        request = factory.post("/api/checkout/", {"address_id": address_id, "carrier_id": carrier_id},
+                               format="json", HTTP_HOST="localhost")
+        force_authenticate(request, user=buyer)
+        started = time.perf_counter()
+        try:
+            if legacy:
+                with transaction.atomic():
+                    response = view(request)
+            else:
+                response = view(request)
+            return response.status_code, time.perf_counter() - started
+        except Exception as e:
+            return type(e).__name__, time.perf_counter() - started
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        checkouts, legacy = options["checkouts"], options["legacy"]
+        category, carrier, buyers = self.setup(tag, checkouts)
+        fake_stripe.latency = options["latency"]
+        view = CheckoutAPIView.as_view()
+        factory = APIRequestFactory()
+        start = threading.Event()
+        try:
+            with override_settings(STRIPE_FAKE=True), ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+                futures = [
+                    pool.submit(self.checkout, view, factory, buyer, address_id, carrier.pk, legacy, start)
+                    for buyer, address_id in buyers
+                ]
+                started = time.perf_counter()
+                start.set()
+                results = [future.result() for future in futures]
+                elapsed = time.perf_counter() - started
+        finally:
+            User.objects.filter(email__startswith=f"bench-{tag}").delete()
+            category.delete()
+            carrier.delete()
+
+        latencies = sorted(latency for _, latency in results)
+        outcomes = Counter(str(code) for code, _ in results)
+        mode = "legacy (Stripe inside the transaction)" if legacy else "outbox (Stripe after commit)"
+        self.stdout.write(f"{mode}: {checkouts} checkouts, {options['workers']} workers, "
+                          f"{options['latency'] * 1000:.0f} ms Stripe latency")
+        for outcome, count in sorted(outcomes.items()):
+            self.stdout.write(f"  {outcome:<24} {count}")
+        self.stdout.write(f"  throughput   {outcomes['201'] / elapsed:8.1f} completed checkouts/s")
+        self.stdout.write(f"  p50          {statistics.median(latencies) * 1000:8.1f} ms")
+        self.stdout.write(f"  p95          {latencies[int(len(latencies) * 0.95) - 1] * 1000:8.1f} ms")
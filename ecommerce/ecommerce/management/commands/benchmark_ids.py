@@ -0,0 +1,44 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from utils.generate_tracking import IdGenerator
+
+
+def legacy_id():
+    # The generator this module replaced: second resolution plus six random characters.
+    timestamp = str(int(time.time()))
+    random_chars = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+    return f"ID/{timestamp}/{random_chars}"
+
+
+class Command(BaseCommand):
+    help = "Measure ID generation throughput one at a time and in blocks, against the old random IDs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=500000)
+        parser.add_argument("--block", type=int, default=1000, help="IDs per block allocation.")
+
+    def report(self, label, ids, elapsed):
+        duplicates = len(ids) - len(set(ids))
+        self.stdout.write(f"{label:<10} {len(ids) / elapsed:>14,.0f} ids/s   {duplicates} duplicates")
+
+    def handle(self, *args, **options):
+        count, block = options["count"], options["block"]
+        generator = IdGenerator()
+
+        started = time.perf_counter()
+        ids = [legacy_id() for _ in range(count)]
+        self.report("legacy", ids, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        ids = [generator.next_id() for _ in range(count)]
+        self.report("single", ids, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        ids = []
+        for _ in range(0, count, block):
+            ids += generator.block(block)
+        self.report(f"block/{block}", ids, time.perf_counter() - started)
@@ -0,0 +1,58 @@
+import gzip
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from ecommerce.middleware import brotli
+from ecommerce.models import Product
+from ecommerce.renderers import FastJSONRenderer, orjson
+from ecommerce.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare JSON encode cost and compressed size for a page of products."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100)
+        parser.add_argument("--iterations", type=int, default=200)
+
+    def build_page(self, size):
+        now = timezone.now()
+        products = [
+            Product(
+                id=i, name=f"Product {i}", sku=f"SKU-{i:06d}", user_id=1,
+                description="Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 8,
+                price=Decimal("1999.99") + i, stock=i, category_id=1, subcategory_id=1,
+                created_at=now, updated_at=now, rating_average=Decimal("4.25"), rating_count=i,
+            )
+            for i in range(size)
+        ]
+        # Serialized once, outside the timed loop: only the encoding step is measured.
+        return {"count": size, "next": None, "previous": None,
+                "results": ProductSerializer(products, many=True).data}
+
+    def time_renderer(self, renderer, data, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            body = renderer.render(data)
+        return (time.perf_counter() - started) / iterations * 1000, body
+
+    def handle(self, *args, **options):
+        data = self.build_page(options["products"])
+        iterations = options["iterations"]
+        baseline_ms, body = self.time_renderer(JSONRenderer(), data, iterations)
+        fast_ms, _ = self.time_renderer(FastJSONRenderer(), data, iterations)
+
+        self.stdout.write(f"{options['products']}-product page, {iterations} iterations")
+        self.stdout.write(f"  JSONRenderer      {baseline_ms:8.3f} ms/render")
+        self.stdout.write(f"  FastJSONRenderer  {fast_ms:8.3f} ms/render "
+                          f"({'orjson' if orjson else 'stdlib fallback'}, {baseline_ms / fast_ms:.1f}x)")
+        self.stdout.write(f"  body              {len(body):8d} bytes")
+        self.stdout.write(f"  gzip              {len(gzip.compress(body)):8d} bytes")
+        if brotli is not None:
+            self.stdout.write(f"  brotli (q=5)      {len(brotli.compress(body, quality=5)):8d} bytes")
+        else:
+            self.stdout.write("  brotli            not installed")
@@ -0,0 +1,28 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.bulk import stream_export
+
+
+class Command(BaseCommand):
+    help = "Stream a seller's catalog to CSV or JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seller", required=True, help="Email of the seller that owns the products.")
+        parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+        parser.add_argument("--output", help="File to write to; defaults to stdout.")
+
+    def handle(self, *args, **options):
+        try:
+            seller = get_user_model().objects.get(email=options["seller"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Seller {options['seller']} not found.")
+        out = open(options["output"], "w", newline="") if options["output"] else sys.stdout
+        try:
+            for chunk in stream_export(seller, options["format"]):
+                out.write(chunk)
+        finally:
+            if options["output"]:
+                out.close()
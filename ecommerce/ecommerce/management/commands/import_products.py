@@ -0,0 +1,32 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.bulk import detect_format, import_products, iter_rows
+
+
+class Command(BaseCommand):
+    help = "Stream a CSV or JSONL catalog file into a seller's products, upserting on SKU."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--seller", required=True, help="Email of the seller that owns the products.")
+        parser.add_argument("--format", choices=["csv", "jsonl"])
+        parser.add_argument("--errors", help="Write the per-row error report to this JSONL file.")
+
+    def handle(self, *args, **options):
+        try:
+            seller = get_user_model().objects.get(email=options["seller"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Seller {options['seller']} not found.")
+        fmt = options["format"] or detect_format(options["path"])
+        with open(options["path"], "rb") as stream:
+            report = import_products(seller, iter_rows(stream, fmt))
+        if options["errors"]:
+            with open(options["errors"], "w") as out:
+                for error in report.errors:
+                    out.write(json.dumps(error) + "\n")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report.created}, updated {report.updated}, failed {len(report.errors)}."
+        ))
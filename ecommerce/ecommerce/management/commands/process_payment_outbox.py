@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ecommerce.outbox import dispatch_due
+
+
+class Command(BaseCommand):
+    help = "Create Stripe checkout sessions that checkout could not create inline, retrying with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=100, help="Messages per pass.")
+        parser.add_argument("--loop", action="store_true", help="Keep polling instead of exiting after one pass.")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds to sleep when nothing was due.")
+
+    def handle(self, *args, **options):
+        while True:
+            attempted = dispatch_due(options["limit"])
+            if not options["loop"]:
+                self.stdout.write(self.style.SUCCESS(f"Dispatched {attempted} payment outbox messages."))
+                return
+            if not attempted:
+                time.sleep(options["interval"])
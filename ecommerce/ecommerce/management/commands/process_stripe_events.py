@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ecommerce.webhooks import process_due
+
+
+class Command(BaseCommand):
+    help = "Apply stored Stripe webhook events to orders, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=100, help="Events per pass.")
+        parser.add_argument("--loop", action="store_true", help="Keep polling instead of exiting after one pass.")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds to sleep when nothing was due.")
+
+    def handle(self, *args, **options):
+        while True:
+            attempted = process_due(options["limit"])
+            if not options["loop"]:
+                self.stdout.write(self.style.SUCCESS(f"Processed {attempted} Stripe events."))
+                return
+            if not attempted:
+                time.sleep(options["interval"])
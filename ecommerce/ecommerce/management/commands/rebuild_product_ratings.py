@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute product rating averages, counts and star histograms from reviews."
+
+    def handle(self, *args, **options):
+        updated = rebuild_ratings()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings for {updated} reviewed products."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce.models import Product
+from ecommerce.search import index_products
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index."
+
+    def handle(self, *args, **options):
+        product_ids = Product.objects.order_by("pk").values_list("pk", flat=True)
+        index_products(product_ids.iterator())
+        self.stdout.write(self.style.SUCCESS(f"Indexed {product_ids.count()} products."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = "Return stock held by unpaid checkouts whose reservation has expired. Run it from cron every minute."
+
+    def handle(self, *args, **options):
+        released = release_expired()
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired stock reservations."))
@@ -0,0 +1,89 @@
+import hashlib
+import hmac
+import json
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIRequestFactory
+
+from ecommerce.models import Order
+from ecommerce.views import StripeWebhookView
+from ecommerce.webhooks import HANDLERS, process_due
+
+
+def sign(payload, secret, timestamp=None):
+    """A ``Stripe-Signature`` header for ``payload``, as Stripe computes it."""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def build_event(order, event_type):
+    paid = event_type in ("checkout.session.completed", "checkout.session.async_payment_succeeded")
+    session = {
+        "id": order.session_id or f"cs_replay_{order.pk}",
+        "object": "checkout.session",
+        "payment_status": "paid" if paid else "unpaid",
+        "payment_intent": order.payment_intent_id or f"pi_replay_{order.pk}",
+        "metadata": {"order_id": str(order.pk)},
+    }
+    return {"id": f"evt_replay_{uuid.uuid4().hex}", "object": "event", "type": event_type,
+            "created": int(time.time()), "data": {"object": session}}
+
+
+class Command(BaseCommand):
+    help = (
+        "Sign and deliver Stripe events to the webhook endpoint, in-process or over HTTP. "
+        "Events come from a JSON-lines file (e.g. saved from the Stripe CLI) or are synthesized for an order."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", help="JSON-lines file of Stripe event objects.")
+        parser.add_argument("--order", type=int, action="append", default=[], help="Synthesize an event for this order.")
+        parser.add_argument("--type", default="checkout.session.completed", choices=sorted(HANDLERS))
+        parser.add_argument("--duplicates", type=int, default=1, help="Deliver every event this many times.")
+        parser.add_argument("--url", help="POST to a running server instead of calling the view in-process.")
+        parser.add_argument("--secret", help="Signing secret; defaults to STRIPE_WEBHOOK_SECRET.")
+        parser.add_argument("--process", action="store_true", help="Apply the stored events afterwards.")
+
+    def load_events(self, options):
+        events = []
+        if options["file"]:
+            with open(options["file"]) as f:
+                events.extend(json.loads(line) for line in f if line.strip())
+        for order in Order.objects.filter(pk__in=options["order"]):
+            events.append(build_event(order, options["type"]))
+        if not events:
+            raise CommandError("Nothing to replay: pass --file or --order.")
+        return events
+
+    def deliver(self, payload, header, url):
+        if url:
+            request = urllib.request.Request(url, data=payload.encode(), method="POST", headers={
+                "Content-Type": "application/json", "Stripe-Signature": header})
+            try:
+                with urllib.request.urlopen(request, timeout=10) as response:
+                    return response.status, response.read().decode()
+            except urllib.error.HTTPError as e:
+                return e.code, e.read().decode()
+        request = APIRequestFactory().post("/api/payments/webhook/", data=payload, content_type="application/json",
+                                           HTTP_STRIPE_SIGNATURE=header)
+        response = StripeWebhookView.as_view()(request)
+        response.render()
+        return response.status_code, response.content.decode()
+
+    def handle(self, *args, **options):
+        secret = options["secret"] or settings.STRIPE_WEBHOOK_SECRET
+        if not secret:
+            raise CommandError("No signing secret: set STRIPE_WEBHOOK_SECRET or pass --secret.")
+        for event in self.load_events(options):
+            payload = json.dumps(event)
+            for _ in range(options["duplicates"]):
+                code, body = self.deliver(payload, sign(payload, secret), options["url"])
+                self.stdout.write(f"{event['id']} {event['type']}: {code} {body}")
+        if options["process"]:
+            self.stdout.write(self.style.SUCCESS(f"Processed {process_due()} Stripe events."))
@@ -0,0 +1,50 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ecommerce.jobs import work
+
+
+def _worker(stop, options):
+    # Ctrl-C reaches the whole process group; let the parent coordinate shutdown.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    try:
+        work(batch=options["batch"], idle_sleep=options["interval"], drain=options["drain"], stop=stop)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Run background jobs from the database queue, optionally across several worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=1, help="Worker processes to start.")
+        parser.add_argument("--batch", type=int, default=10, help="Jobs each worker claims at a time.")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds to sleep when nothing was due.")
+        parser.add_argument("--drain", action="store_true", help="Exit once no jobs are due instead of polling.")
+
+    def handle(self, *args, **options):
+        # Workers are forked, so none may inherit the parent's database connection.
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        stop = context.Event()
+        workers = [context.Process(target=_worker, args=(stop, options), daemon=True)
+                   for _ in range(options["processes"])]
+        for process in workers:
+            process.start()
+
+        def shutdown(*args):
+            stop.set()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+        for process in workers:
+            process.join()
+        failed = [process.exitcode for process in workers if process.exitcode]
+        if failed:
+            self.stderr.write(self.style.ERROR(f"{len(failed)} worker(s) exited abnormally."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{len(workers)} worker(s) stopped."))
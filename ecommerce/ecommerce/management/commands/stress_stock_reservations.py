@@ -0,0 +1,74 @@
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from accounts.models import User
+from ecommerce.models import Category, Order, Product, StockReservation, Subcategory
+from ecommerce.reservations import InsufficientStock, reserve_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Race many parallel checkouts for one product and verify nothing is oversold. "
+        "Run against PostgreSQL; SQLite serializes writers and reports lock errors instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stock", type=int, default=100)
+        parser.add_argument("--checkouts", type=int, default=500)
+        parser.add_argument("--quantity", type=int, default=1)
+        parser.add_argument("--workers", type=int, default=32)
+
+    def checkout(self, buyer, product, quantity, start):
+        start.wait()
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(user=buyer, total_price=product.price * quantity)
+                reserve_stock(order, {product.pk: quantity})
+            return "reserved"
+        except InsufficientStock:
+            return "sold out"
+        except Exception as e:
+            return f"error: {type(e).__name__}"
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        stock, quantity, checkouts = options["stock"], options["quantity"], options["checkouts"]
+        tag = uuid.uuid4().hex[:8]
+        buyer = User.objects.create_user(email=f"stress-{tag}@example.com", first_name="Stress",
+                                         last_name="Test", role="buyer")
+        category = Category.objects.create(name=f"stress-{tag}")
+        subcategory = Subcategory.objects.create(name=f"stress-{tag}", category=category)
+        product = Product.objects.create(user=buyer, name=f"stress-{tag}", description="", price=1, stock=stock,
+                                         category=category, subcategory=subcategory)
+        try:
+            start = threading.Event()
+            with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+                futures = [pool.submit(self.checkout, buyer, product, quantity, start) for _ in range(checkouts)]
+                started = time.perf_counter()
+                start.set()
+                outcomes = Counter(future.result() for future in futures)
+            elapsed = time.perf_counter() - started
+
+            product.refresh_from_db()
+            held = StockReservation.objects.filter(product=product).aggregate(total=Sum("quantity"))["total"] or 0
+            for outcome, count in sorted(outcomes.items()):
+                self.stdout.write(f"  {outcome:<24} {count}")
+            self.stdout.write(f"  {checkouts} checkouts in {elapsed:.2f}s; stock left {product.stock}, held {held}")
+
+            expected = min(stock // quantity, checkouts) * quantity
+            if product.stock < 0 or product.stock + held != stock or outcomes["reserved"] * quantity != held:
+                raise CommandError(f"Oversold: started with {stock}, {held} held, {product.stock} left.")
+            if not any(outcome.startswith("error") for outcome in outcomes) and held != expected:
+                raise CommandError(f"Undersold: expected {expected} held, got {held}.")
+            self.stdout.write(self.style.SUCCESS("No oversell."))
+        finally:
+            buyer.delete()
+            category.delete()
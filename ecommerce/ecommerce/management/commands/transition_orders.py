@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.fulfilment import TRANSITIONS, transition_orders
+from ecommerce.models import Order
+
+
+class Command(BaseCommand):
+    help = "Move a batch of orders to a new status, enforcing the order state machine."
+
+    def add_arguments(self, parser):
+        parser.add_argument("status", choices=sorted(TRANSITIONS), help="Status to move the orders to.")
+        parser.add_argument("--ids", nargs="+", type=int, default=[], help="Order ids.")
+        parser.add_argument("--file", help="File of order ids, one per line.")
+        parser.add_argument("--from-status", choices=sorted(TRANSITIONS),
+                            help="Also move every order currently in this status.")
+        parser.add_argument("--json", action="store_true", help="Print the result for each order as JSON lines.")
+
+    def handle(self, *args, **options):
+        order_ids = list(options["ids"])
+        if options["file"]:
+            with open(options["file"]) as f:
+                order_ids += [int(line) for line in f if line.strip()]
+        if options["from_status"]:
+            order_ids += Order.objects.filter(status=options["from_status"]).order_by("pk").values_list("pk", flat=True)
+        if not order_ids:
+            raise CommandError("Give order ids with --ids, --file or --from-status.")
+
+        results = transition_orders(order_ids, options["status"])
+        for result in results:
+            if options["json"]:
+                self.stdout.write(json.dumps(result))
+            elif not result["ok"]:
+                self.stderr.write(f"Order {result['id']}: {result['error']}")
+        updated = sum(result["ok"] for result in results)
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {updated} of {len(results)} orders to {options['status']}."
+        ))
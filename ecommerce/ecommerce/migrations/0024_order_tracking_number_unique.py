@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:51
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+from utils.generate_tracking import generate_custom_ids
+
+
+def reassign_duplicate_tracking_numbers(apps, schema_editor):
+    """Give every order but the oldest sharing a tracking number a fresh one before the index is added."""
+    Order = apps.get_model('ecommerce', 'Order')
+    Order.objects.filter(tracking_number='').update(tracking_number=None)
+    duplicates = (
+        Order.objects.exclude(tracking_number=None).values('tracking_number')
+        .annotate(orders=Count('id'), keep=Min('id'))
+        .filter(orders__gt=1)
+    )
+    for row in duplicates.iterator():
+        others = list(
+            Order.objects.filter(tracking_number=row['tracking_number']).exclude(id=row['keep'])
+            .values_list('id', flat=True)
+        )
+        for order_id, tracking_number in zip(others, generate_custom_ids(len(others))):
+            Order.objects.filter(id=order_id).update(tracking_number=tracking_number)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0023_job_queue'),
+    ]
+
+    operations = [
+        migrations.RunPython(reassign_duplicate_tracking_numbers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='tracking_number',
+            field=models.CharField(blank=True, max_length=50, null=True, unique=True),
+        ),
+    ]
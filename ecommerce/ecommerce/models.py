@@ -1,6 +1,7 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils.timezone import now
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 
 User = get_user_model()
 
@@ -25,6 +26,7 @@ class Subcategory(models.Model):
 
 class Product(models.Model):
     name = models.CharField(max_length=255)
+    sku = models.CharField(max_length=64, null=True, blank=True)
     user = models.ForeignKey(User,related_name="products", on_delete=models.CASCADE)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -33,13 +35,45 @@ class Product(models.Model):
     subcategory = models.ForeignKey(Subcategory, related_name="products", on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    rating_average = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
 
     class Meta:
         db_table = "product"
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="product_created_id_idx"),
+            models.Index(fields=["price", "id"], name="product_price_id_idx"),
+            models.Index(fields=["name", "id"], name="product_name_id_idx"),
+            models.Index(fields=["stock", "id"], name="product_stock_id_idx"),
+            models.Index(fields=["rating_average", "id"], name="product_rating_avg_id_idx"),
+            models.Index(fields=["rating_count", "id"], name="product_rating_count_id_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "sku"], name="product_user_sku_unique"),
+        ]
 
     def __str__(self):
         return self.name
 
+class ProductSearchDocument(models.Model):
+    product = models.OneToOneField(Product, primary_key=True, related_name="search_document", on_delete=models.CASCADE)
+    title = models.TextField()
+    taxonomy = models.TextField()
+    body = models.TextField()
+    search_vector = SearchVectorField(null=True)
+
+    class Meta:
+        db_table = "product_search_document"
+
+    def __str__(self):
+        return self.title
+
 class Review(models.Model):
     product = models.ForeignKey(Product, related_name="reviews", on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -49,10 +83,22 @@ class Review(models.Model):
 
     class Meta:
         db_table = "Review"
+        indexes = [
+            models.Index(fields=["product", "created_at", "id"], name="review_product_created_id_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.product.name} ({self.rating})"
 
+    # Keep the review write and the product rating aggregate update in one transaction.
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
 
 
 class CartItem(models.Model):
@@ -63,6 +109,9 @@ class CartItem(models.Model):
 
     class Meta:
         db_table = "CartItem"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "product"], name="cartitem_user_product_unique"),
+        ]
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name} in {self.user.email}'s cart"
@@ -125,23 +174,120 @@ class Order(models.Model):
     coupon = models.ForeignKey(Coupon, null=True, blank=True, on_delete=models.SET_NULL)
     address = models.ForeignKey(ShippingAddress,null=True,blank=True,related_name="orders",on_delete=models.CASCADE)
     discount_applied = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
-    tracking_number = models.CharField(max_length=50, blank=True, null=True)
+    tracking_number = models.CharField(max_length=50, blank=True, null=True, unique=True)
     shipping_carrier = models.ForeignKey(ShippingCarrier,on_delete=models.CASCADE, blank=True, null=True,related_name="orders")
     tracking_url = models.URLField(blank=True, null=True)
     payment_status = models.CharField(max_length=10, choices=PAYMENT_STATUS_CHOICES, default="pending")
     payment_intent_id = models.CharField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
     session_id = models.CharField(null=True, blank=True)
+    checkout_url = models.CharField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
 
 
     class Meta:
         db_table = "Order"
+        indexes = [
+            models.Index(fields=["user", "created_at", "id"], name="order_user_created_id_idx"),
+        ]
 
     # def __str__(self):
     #     return f"{self.user.first_name}"
 
+class StockReservation(models.Model):
+    STATUS_CHOICES = [
+        ("held", "Held"),
+        ("committed", "Committed"),
+        ("released", "Released"),
+    ]
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="reservations")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reservations")
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="held")
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "Stock_Reservation"
+        indexes = [
+            models.Index(fields=["status", "expires_at"], name="reservation_status_expiry_idx"),
+        ]
+
+
+class PaymentOutbox(models.Model):
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name="payment_outbox")
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=now)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "Payment_Outbox"
+        indexes = [
+            models.Index(fields=["status", "available_at"], name="outbox_status_available_idx"),
+        ]
+
+
+class StripeEvent(models.Model):
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("processed", "Processed"),
+        ("failed", "Failed"),
+    ]
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=now)
+    last_error = models.TextField(blank=True, default="")
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "Stripe_Event"
+        indexes = [
+            models.Index(fields=["status", "available_at"], name="stripe_event_status_avail_idx"),
+        ]
+
+
+class Job(models.Model):
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+    task = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True, default="")
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "Job"
+        indexes = [
+            models.Index(fields=["status", "run_at"], name="job_status_run_at_idx"),
+            models.Index(fields=["status", "locked_until"], name="job_status_locked_until_idx"),
+        ]
+
+
 class OrderItem(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
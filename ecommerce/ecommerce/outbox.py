@@ -0,0 +1,143 @@
+import logging
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .gateway import CircuitOpen, get_gateway
+from .models import Order, PaymentOutbox, StockReservation
+from .reservations import HELD, get_ttl, release_reservations
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+# A claimed message is invisible to other dispatchers for this long, which
+# must comfortably exceed one Stripe call.
+LEASE_SECONDS = 60
+BASE_BACKOFF_SECONDS = 2
+MAX_BACKOFF_SECONDS = 300
+
+logger = logging.getLogger(__name__)
+
+
+def get_max_attempts():
+    return getattr(settings, "PAYMENT_OUTBOX_MAX_ATTEMPTS", 8)
+
+
+def backoff(attempts):
+    delay = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def enqueue_checkout_session(order, line_items, success_url, cancel_url, metadata):
+    """Record the Stripe session to create for ``order``; call inside the transaction that creates the order."""
+    return PaymentOutbox.objects.create(
+        order=order,
+        payload={
+            "line_items": line_items,
+            "success_url": success_url,
+            "cancel_url": cancel_url,
+            "metadata": metadata,
+        },
+    )
+
+
+def _claim(message_id):
+    now = timezone.now()
+    claimed = PaymentOutbox.objects.filter(pk=message_id, status=PENDING, available_at__lte=now).update(
+        available_at=now + timedelta(seconds=LEASE_SECONDS), attempts=F("attempts") + 1, updated_at=now
+    )
+    return PaymentOutbox.objects.select_related("order").get(pk=message_id) if claimed else None
+
+
+def _reserved_until(message):
+    """
+    When the order's stock hold and Stripe session end. Fixed on the first
+    attempt and kept in the payload, so every retry sends Stripe the same
+    parameters under the same idempotency key.
+    """
+    if "reserved_until" not in message.payload:
+        message.payload["reserved_until"] = int((timezone.now() + timedelta(seconds=get_ttl())).timestamp())
+        PaymentOutbox.objects.filter(pk=message.pk).update(payload=message.payload)
+    return datetime.fromtimestamp(message.payload["reserved_until"], tz=dt_timezone.utc)
+
+
+def _fail(message, error):
+    with transaction.atomic():
+        PaymentOutbox.objects.filter(pk=message.pk).update(status=FAILED, last_error=error, updated_at=timezone.now())
+        order = message.order
+        order.status = "cancelled"
+        order.payment_status = "failed"
+        order.save(update_fields=["status", "payment_status", "updated_at"])
+    release_reservations(order)
+    logger.warning("Giving up on a payment session for order %s: %s", order.pk, error)
+
+
+def dispatch(message_id):
+    """
+    Create the Stripe checkout session for one outbox message, outside any
+    transaction. Returns the message, or ``None`` when it is not due, another
+    dispatcher holds it, or the gateway's circuit breaker is open. Failures
+    are rescheduled with backoff until ``PAYMENT_OUTBOX_MAX_ATTEMPTS``, after
+    which the order is cancelled.
+    """
+    # While the breaker is open Stripe would not be called, so leave the message unclaimed.
+    if get_gateway().breaker.state == "open":
+        return None
+    message = _claim(message_id)
+    if message is None:
+        return None
+    order = message.order
+    reserved_until = _reserved_until(message)
+    # The hold lasts until the session expires, so the session never outlives it.
+    if not StockReservation.objects.filter(order=order, status=HELD).update(expires_at=reserved_until):
+        _fail(message, "Stock reservation expired before a payment session was created.")
+        return message
+    payload = message.payload
+    try:
+        session = get_gateway().create_checkout_session(
+            payment_method_types=["card"],
+            line_items=payload["line_items"],
+            mode="payment",
+            success_url=payload["success_url"],
+            cancel_url=payload["cancel_url"],
+            metadata=payload["metadata"],
+            expires_at=int(reserved_until.timestamp()) - settings.STRIPE_SESSION_EXPIRY_MARGIN,
+            # Stripe returns the original session when a retry repeats the key with the same
+            # parameters, and rejects the retry if any of them changed.
+            idempotency_key=f"checkout-session-{order.pk}",
+        )
+    except stripe.error.StripeError as e:
+        # The breaker can still refuse the call (another trial is in flight); Stripe was not
+        # even tried then, so the claim is handed back without spending an attempt.
+        short_circuited = isinstance(e, CircuitOpen)
+        if message.attempts >= get_max_attempts() and not short_circuited:
+            _fail(message, str(e))
+        else:
+            PaymentOutbox.objects.filter(pk=message.pk).update(
+                attempts=F("attempts") - short_circuited, available_at=timezone.now() + backoff(message.attempts),
+                last_error=str(e), updated_at=timezone.now()
+            )
+        return message
+    with transaction.atomic():
+        Order.objects.filter(pk=order.pk).update(session_id=session.id, checkout_url=session.url,
+                                                 updated_at=timezone.now())
+        PaymentOutbox.objects.filter(pk=message.pk).update(status=SENT, last_error="", updated_at=timezone.now())
+    order.session_id, order.checkout_url = session.id, session.url
+    message.status = SENT
+    return message
+
+
+def dispatch_due(limit=100):
+    """Dispatch up to ``limit`` due messages, oldest first. Returns how many were attempted."""
+    due = PaymentOutbox.objects.filter(status=PENDING, available_at__lte=timezone.now()).order_by("available_at")
+    attempted = 0
+    for message_id in due.values_list("pk", flat=True)[:limit]:
+        if dispatch(message_id) is not None:
+            attempted += 1
+    return attempted
@@ -0,0 +1,138 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek-based pagination: every page is an indexed range scan on
+    ``(ordering field, id)`` instead of a ``COUNT(*)`` plus ``OFFSET``.
+    """
+
+    cursor_query_param = "cursor"
+    ordering_param = "ordering"
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    tie_breaker = "id"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.field_name = self.ordering.lstrip("-")
+        self.field = queryset.model._meta.get_field(self.field_name)
+
+        cursor = self.decode_cursor(request)
+        backwards = bool(cursor and cursor["r"])
+        # Paging backwards scans the index in the opposite direction and flips the page afterwards.
+        descending = self.ordering.startswith("-") != backwards
+        if cursor:
+            lookup = "lt" if descending else "gt"
+            queryset = queryset.filter(
+                Q(**{f"{self.field_name}__{lookup}": cursor["v"]})
+                | Q(**{self.field_name: cursor["v"], f"{self.tie_breaker}__{lookup}": cursor["id"]})
+            )
+        prefix = "-" if descending else ""
+        queryset = queryset.order_by(prefix + self.field_name, prefix + self.tie_breaker)
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if backwards:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        requested = request.query_params.get(self.ordering_param, "").split(",")[0].strip()
+        allowed = getattr(view, "ordering_fields", None) or []
+        if requested and requested.lstrip("-") in allowed:
+            return requested
+        # Only a concrete column can seed a cursor; annotations such as a search rank fall back to the id.
+        concrete = {field.name for field in queryset.model._meta.concrete_fields}
+        for ordering in queryset.query.order_by:
+            if isinstance(ordering, str) and ordering.lstrip("-") in concrete:
+                return ordering
+        return "-" + self.tie_breaker
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            cursor["v"] = self.field.to_python(cursor["v"])
+            cursor["id"] = int(cursor["id"])
+            cursor["r"] = bool(cursor.get("r"))
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, obj, backwards):
+        payload = {"v": self.field.value_to_string(obj), "id": getattr(obj, self.tie_breaker), "r": backwards}
+        encoded = base64.urlsafe_b64encode(json.dumps(payload).encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], backwards=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], backwards=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]))
+
+
+class CursorOptInPagination(PageNumberPagination):
+    """Page-number pagination unless the request carries ``?cursor=``, which switches to keyset paging."""
+
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_class.cursor_query_param in request.query_params:
+            self.keyset = self.keyset_class()
+            self.keyset.page_size = self.get_page_size(request)
+            self.keyset.page_size_query_param = None
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
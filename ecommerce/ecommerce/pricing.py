@@ -0,0 +1,166 @@
+from collections import namedtuple
+from decimal import ROUND_HALF_UP, Decimal
+
+from .models import CartItem, Coupon, Product, ShippingCarrier
+
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+
+def money(amount):
+    return Decimal(amount).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def to_minor_units(amount):
+    """Paise (or cents) as Stripe expects them."""
+    return int(money(amount) * 100)
+
+
+class Line(namedtuple("Line", "product_id name unit_price quantity")):
+    @property
+    def line_total(self):
+        return money(self.unit_price * self.quantity)
+
+
+class Quote:
+    def __init__(self, lines, subtotal, discount, shipping, total, coupon=None, carrier=None, errors=None):
+        self.lines = lines
+        self.subtotal = subtotal
+        self.discount = discount
+        self.shipping = shipping
+        self.total = total
+        self.coupon = coupon
+        self.carrier = carrier
+        self.errors = errors or []
+
+    @property
+    def coupon_code(self):
+        return self.coupon.code if self.coupon else None
+
+    @property
+    def carrier_id(self):
+        return self.carrier.pk if self.carrier else None
+
+
+def coupon_discount(coupon, subtotal):
+    """``(discount, error)`` for ``coupon`` against ``subtotal``; the discount never exceeds the subtotal."""
+    if not coupon.is_valid():
+        return ZERO, "Coupon expired or invalid"
+    if subtotal < coupon.min_order_value:
+        return ZERO, "Order total is too low for this coupon"
+    discount = coupon.discount_value
+    if coupon.discount_type == "percent":
+        discount = subtotal * coupon.discount_value / 100
+        if coupon.max_discount:
+            discount = min(discount, coupon.max_discount)
+    return money(min(discount, subtotal)), None
+
+
+def price(lines, coupon=None, carrier=None, subtotal=None):
+    """
+    Price ``lines`` in one pass: line totals, subtotal, coupon discount (on
+    the goods only), shipping from the carrier, and the grand total. Coupon
+    problems are reported in ``errors`` rather than raised. ``subtotal``
+    prices a bare amount when there are no lines (coupon previews).
+    """
+    if subtotal is None:
+        subtotal = sum((line.line_total for line in lines), ZERO)
+    subtotal = money(subtotal)
+    errors = []
+    discount = ZERO
+    if coupon is not None:
+        discount, error = coupon_discount(coupon, subtotal)
+        if error:
+            errors.append(error)
+    shipping = money(carrier.price) if carrier is not None else ZERO
+    return Quote(lines, subtotal, discount, shipping, subtotal - discount + shipping, coupon, carrier, errors)
+
+
+def cart_lines(user):
+    """The user's cart as pricing lines, in one query."""
+    rows = (
+        CartItem.objects.filter(user=user)
+        .order_by("created_at", "id")
+        .values_list("product_id", "product__name", "product__price", "quantity")
+    )
+    return [Line(*row) for row in rows]
+
+
+def quote_many(requests, user=None):
+    """
+    Price a batch of requests, each a dict with optional ``items``
+    (``{product_id: quantity}``, defaulting to ``user``'s cart),
+    ``coupon_code`` and ``carrier_id``. The cart, products, coupons and
+    carriers for the whole batch are loaded with one query each, however
+    many requests there are. Returns one ``Quote`` per request, in order.
+    """
+    product_ids = set()
+    for request in requests:
+        product_ids.update(request.get("items") or ())
+    products = {
+        pk: (name, unit_price)
+        for pk, name, unit_price in Product.objects.filter(pk__in=product_ids).values_list("pk", "name", "price")
+    } if product_ids else {}
+    codes = {request["coupon_code"] for request in requests if request.get("coupon_code")}
+    coupons = {coupon.code: coupon for coupon in Coupon.objects.filter(code__in=codes, is_active=True)} if codes else {}
+    carrier_ids = {request["carrier_id"] for request in requests if request.get("carrier_id")}
+    carriers = ShippingCarrier.objects.in_bulk(carrier_ids) if carrier_ids else {}
+    cart = cart_lines(user) if any(request.get("items") is None for request in requests) else []
+
+    quotes = []
+    for request in requests:
+        errors = []
+        items = request.get("items")
+        if items is None:
+            lines = cart
+        else:
+            lines = [Line(pk, *products[pk], quantity) for pk, quantity in items.items() if pk in products]
+            missing = [pk for pk in items if pk not in products]
+            if missing:
+                errors.append(f"Products not found: {missing}")
+        coupon = coupons.get(request.get("coupon_code"))
+        if request.get("coupon_code") and coupon is None:
+            errors.append("Invalid coupon code")
+        carrier = carriers.get(request.get("carrier_id"))
+        if request.get("carrier_id") and carrier is None:
+            errors.append("Invalid shipping carrier")
+        quote = price(lines, coupon, carrier)
+        quote.errors = errors + quote.errors
+        quotes.append(quote)
+    return quotes
+
+
+def stripe_line_items(quote, order_id, currency="inr"):
+    """
+    Stripe Checkout line items that add up to ``quote.total`` exactly.
+    Checkout has no negative lines, so a discounted order is sent as one
+    line for the discounted goods; shipping is its own line.
+    """
+    if quote.discount:
+        items = [{
+            "price_data": {
+                "currency": currency,
+                "product_data": {"name": f"Order #{order_id} ({quote.coupon_code} applied)"},
+                "unit_amount": to_minor_units(quote.subtotal - quote.discount),
+            },
+            "quantity": 1,
+        }]
+    else:
+        items = [{
+            "price_data": {
+                "currency": currency,
+                "product_data": {"name": line.name},
+                "unit_amount": to_minor_units(line.unit_price),
+            },
+            "quantity": line.quantity,
+        } for line in quote.lines]
+    if quote.shipping:
+        items.append({
+            "price_data": {
+                "currency": currency,
+                "product_data": {"name": f"Shipping: {quote.carrier.name}"},
+                "unit_amount": to_minor_units(quote.shipping),
+            },
+            "quantity": 1,
+        })
+    return items
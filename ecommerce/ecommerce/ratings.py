@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Now, NullIf
+
+from .models import Product, Review
+
+STARS = range(1, 6)
+REBUILD_BATCH_SIZE = 1000
+
+
+def apply_rating_change(product_id, added=None, removed=None):
+    """
+    Adjust a product's rating aggregates for one review being added, removed
+    or re-rated, as a single UPDATE computed from the row's current values.
+    """
+    count_delta = (added is not None) - (removed is not None)
+    sum_delta = (added or 0) - (removed or 0)
+    if not count_delta and not sum_delta:
+        return
+    updates = {
+        "rating_count": F("rating_count") + count_delta,
+        "rating_sum": F("rating_sum") + sum_delta,
+        "rating_average": Coalesce(
+            Cast(F("rating_sum") + sum_delta, FloatField())
+            / NullIf(F("rating_count") + count_delta, Value(0)),
+            Value(0),
+            output_field=DecimalField(max_digits=3, decimal_places=2),
+        ),
+        # The product payload changed, so move its conditional GET validators too.
+        "updated_at": Now(),
+    }
+    if added is not None:
+        updates[f"rating_{added}"] = F(f"rating_{added}") + 1
+    if removed is not None:
+        updates[f"rating_{removed}"] = F(f"rating_{removed}") - 1
+    Product.objects.filter(pk=product_id).update(**updates)
+
+
+def _empty_aggregates():
+    fields = {"rating_average": 0, "rating_count": 0, "rating_sum": 0}
+    fields.update({f"rating_{star}": 0 for star in STARS})
+    return fields
+
+
+@transaction.atomic
+def rebuild_ratings():
+    """Recompute every product's rating aggregates from the review table."""
+    Product.objects.exclude(rating_count=0).update(**_empty_aggregates())
+    rows = (
+        Review.objects.order_by()
+        .values("product_id")
+        .annotate(
+            count=Count("id"),
+            total=Sum("rating"),
+            **{f"star_{star}": Count("id", filter=Q(rating=star)) for star in STARS}
+        )
+    )
+    fields = list(_empty_aggregates())
+    batch = []
+    updated = 0
+    for row in rows.iterator():
+        product = Product(
+            pk=row["product_id"],
+            rating_count=row["count"],
+            rating_sum=row["total"],
+            rating_average=round(row["total"] / row["count"], 2),
+            **{f"rating_{star}": row[f"star_{star}"] for star in STARS}
+        )
+        batch.append(product)
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            updated += Product.objects.bulk_update(batch, fields)
+            batch = []
+    if batch:
+        updated += Product.objects.bulk_update(batch, fields)
+    return updated
@@ -0,0 +1,162 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import CATEGORY_TREE_NAMESPACE
+from .facets import FACET_NAMESPACE
+from .models import Product, StockReservation
+from .signals import invalidate_model_caches
+
+HELD = "held"
+COMMITTED = "committed"
+RELEASED = "released"
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        super().__init__(f"Insufficient stock for products {product_ids}")
+
+
+def get_ttl():
+    return getattr(settings, "STOCK_RESERVATION_TTL", 40 * 60)
+
+
+# Stock moves through queryset updates, which send no signals: every function
+# below that changes stock invalidates the cached product payloads itself.
+
+def _invalidate_stock_caches(crossed_zero):
+    # Facet counts only see whether a product is in stock, and the category
+    # tree counts products whatever their stock, so checkout traffic leaves
+    # both warm unless a product sold out or came back.
+    keep = (CATEGORY_TREE_NAMESPACE,) if crossed_zero else (CATEGORY_TREE_NAMESPACE, FACET_NAMESPACE)
+    invalidate_model_caches(Product, keep=keep)
+
+
+def _take(product_id, quantity, now):
+    # One conditional UPDATE: the row lock lasts only as long as the enclosing
+    # transaction, and the stock check and decrement cannot interleave.
+    return Product.objects.filter(pk=product_id, stock__gte=quantity).update(
+        stock=F("stock") - quantity, updated_at=now
+    )
+
+
+def _give_back(product_id, quantity, now):
+    Product.objects.filter(pk=product_id).update(stock=F("stock") + quantity, updated_at=now)
+
+
+def reserve_stock(order, quantities, ttl=None):
+    """
+    Hold ``{product_id: quantity}`` for ``order`` until payment is confirmed or
+    the hold expires. Raises ``InsufficientStock`` listing every product that
+    ran short, in which case nothing is held.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=get_ttl() if ttl is None else ttl)
+    with transaction.atomic():
+        # Sorted so two carts sharing products always touch the rows in the same order.
+        short = [product_id for product_id in sorted(quantities) if not _take(product_id, quantities[product_id], now)]
+        if short:
+            raise InsufficientStock(short)
+        StockReservation.objects.bulk_create(
+            StockReservation(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in quantities.items()
+        )
+        _invalidate_stock_caches(Product.objects.filter(pk__in=quantities, stock=0).exists())
+    return expires_at
+
+
+def commit_reservations(order):
+    """
+    Make the order's holds permanent once it is paid. Holds that lapsed in the
+    meantime are taken again if the stock is still there. Returns the product
+    ids that could not be covered.
+    """
+    now = timezone.now()
+    short = []
+    taken = []
+    with transaction.atomic():
+        StockReservation.objects.filter(order=order, status=HELD).update(status=COMMITTED)
+        for pk, product_id, quantity in order.reservations.filter(status=RELEASED).values_list(
+            "pk", "product_id", "quantity"
+        ):
+            with transaction.atomic():
+                if not StockReservation.objects.filter(pk=pk, status=RELEASED).update(status=COMMITTED):
+                    continue
+                if not _take(product_id, quantity, now):
+                    transaction.set_rollback(True)
+                    short.append(product_id)
+                else:
+                    taken.append(product_id)
+        if taken:
+            _invalidate_stock_caches(Product.objects.filter(pk__in=taken, stock=0).exists())
+    if short:
+        logger.warning("Order %s was paid after its stock hold lapsed; products %s are oversold", order.pk, short)
+    return short
+
+
+def _release(queryset):
+    now = timezone.now()
+    released = 0
+    restocked = False
+    for pk, product_id, quantity, status in queryset.values_list("pk", "product_id", "quantity", "status").iterator():
+        with transaction.atomic():
+            # Conditional on the status just read, so a racing commit, sweep or
+            # cancellation settles each hold exactly once.
+            if StockReservation.objects.filter(pk=pk, status=status).update(status=RELEASED):
+                _give_back(product_id, quantity, now)
+                released += 1
+                # Read under the row lock the update just took, so this is exactly "was at zero".
+                restocked = restocked or Product.objects.filter(pk=product_id, stock=quantity).exists()
+    if released:
+        _invalidate_stock_caches(restocked)
+    return released
+
+
+def release_reservations(order, include_committed=False):
+    """Return the order's held stock, and its sold stock too when ``include_committed`` (refunds)."""
+    statuses = [HELD, COMMITTED] if include_committed else [HELD]
+    return _release(order.reservations.filter(status__in=statuses))
+
+
+def release_order_reservations(order_ids, include_committed=False):
+    """``release_reservations`` for many orders at once."""
+    statuses = [HELD, COMMITTED] if include_committed else [HELD]
+    return _release(StockReservation.objects.filter(order_id__in=order_ids, status__in=statuses))
+
+
+def release_expired(product_ids=None):
+    """Return stock held by reservations whose TTL has passed."""
+    queryset = StockReservation.objects.filter(status=HELD, expires_at__lte=timezone.now())
+    if product_ids is not None:
+        queryset = queryset.filter(product_id__in=product_ids)
+    return _release(queryset)
+
+
+def held_quantity():
+    """Units of the outer ``Product`` held by unpaid orders, as an expression for ``annotate``."""
+    held = (
+        StockReservation.objects.filter(product=OuterRef("pk"), status=HELD)
+        .values("product").annotate(total=Sum("quantity")).values("total")
+    )
+    return Coalesce(Subquery(held), 0)
+
+
+def net_of_holds(on_hand):
+    """
+    Turn ``{product_id: units on hand}`` into the ``Product.stock`` values to
+    store. Held units are already out of ``stock`` and go back in when the
+    hold is released, so an absolute count written over them would count
+    them twice. Call inside the transaction that writes the stock.
+    """
+    # Locking the rows orders this write after any hold being taken on them.
+    rows = Product.objects.select_for_update().filter(pk__in=on_hand).order_by("pk")
+    held = dict(rows.annotate(held=held_quantity()).values_list("pk", "held"))
+    return {pk: max(units - held.get(pk, 0), 0) for pk, units in on_hand.items()}
@@ -0,0 +1,113 @@
+import re
+from functools import reduce
+from operator import add
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils.module_loading import import_string
+
+from .models import Product, ProductSearchDocument
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+INDEX_BATCH_SIZE = 1000
+
+
+def tokenize(terms):
+    """Split raw search terms into lowercase word tokens."""
+    return [token.lower() for term in terms for token in TOKEN_RE.findall(term)]
+
+
+class SimpleSearchBackend:
+    """Portable backend that matches every token against the stored document columns."""
+
+    def update_vectors(self, product_ids):
+        pass
+
+    def search(self, queryset, terms):
+        tokens = tokenize(terms)
+        if not tokens:
+            return queryset
+        for token in tokens:
+            queryset = queryset.filter(
+                Q(search_document__title__contains=token)
+                | Q(search_document__taxonomy__contains=token)
+                | Q(search_document__body__contains=token)
+            )
+        rank = reduce(add, [
+            Case(
+                When(search_document__title__contains=token, then=Value(3)),
+                When(search_document__taxonomy__contains=token, then=Value(2)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+            for token in tokens
+        ])
+        return queryset.annotate(search_rank=rank).order_by("-search_rank", "-created_at")
+
+
+class PostgresSearchBackend:
+    """Ranked full-text search over a GIN indexed tsvector column."""
+
+    config = "english"
+
+    def get_vector(self):
+        return (
+            SearchVector("title", weight="A", config=self.config)
+            + SearchVector("taxonomy", weight="B", config=self.config)
+            + SearchVector("body", weight="C", config=self.config)
+        )
+
+    def update_vectors(self, product_ids):
+        ProductSearchDocument.objects.filter(product_id__in=product_ids).update(search_vector=self.get_vector())
+
+    def search(self, queryset, terms):
+        tokens = tokenize(terms)
+        if not tokens:
+            return queryset
+        # Prefix match every token so partial words typed into a search box still hit.
+        query = SearchQuery(" & ".join(f"{token}:*" for token in tokens), config=self.config, search_type="raw")
+        return (
+            queryset.filter(search_document__search_vector=query)
+            .annotate(search_rank=SearchRank(F("search_document__search_vector"), query))
+            .order_by("-search_rank", "-created_at")
+        )
+
+
+def get_search_backend():
+    backend = getattr(settings, "PRODUCT_SEARCH_BACKEND", None)
+    if backend:
+        return import_string(backend)()
+    if connection.vendor == "postgresql":
+        return PostgresSearchBackend()
+    return SimpleSearchBackend()
+
+
+def build_document(product):
+    return ProductSearchDocument(
+        product_id=product.pk,
+        title=product.name.lower(),
+        taxonomy=f"{product.category.name} {product.subcategory.name}".lower(),
+        body=product.description.lower(),
+    )
+
+
+def index_products(product_ids):
+    """Create or refresh the search documents for the given products."""
+    product_ids = list(product_ids)
+    backend = get_search_backend()
+    for start in range(0, len(product_ids), INDEX_BATCH_SIZE):
+        batch = product_ids[start:start + INDEX_BATCH_SIZE]
+        products = (
+            Product.objects.filter(pk__in=batch)
+            .select_related("category", "subcategory")
+            .only("id", "name", "description", "category__name", "subcategory__name")
+        )
+        ProductSearchDocument.objects.bulk_create(
+            [build_document(product) for product in products],
+            update_conflicts=True,
+            unique_fields=["product"],
+            update_fields=["title", "taxonomy", "body"],
+        )
+        backend.update_vectors(batch)
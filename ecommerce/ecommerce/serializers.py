@@ -1,55 +1,214 @@
 from rest_framework import serializers
 from .models import Product, Category, Subcategory, Review,CartItem,Order, OrderItem,Wishlist,Coupon,ShippingAddress,ShippingCarrier
 
-class CategorySerializer(serializers.ModelSerializer):
+
+def parse_fieldset(value):
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+
+class SparseFieldsetMixin:
+    """
+    Trims the serialized fields on GET requests from ``?fields=`` and ``?omit=``.
+    Nested serializers are addressed with dotted paths, e.g.
+    ``?fields=id,quantity,product.name,product.price``; naming a nested field
+    without sub-fields keeps all of its fields.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get("request")
+        if request is None or request.method not in ("GET", "HEAD"):
+            return fields
+        prefix = self.fieldset_prefix()
+        requested = self.fieldset_level(parse_fieldset(request.query_params.get("fields")), prefix)
+        omitted = self.fieldset_level(parse_fieldset(request.query_params.get("omit")), prefix, leaves_only=True)
+        if requested:
+            fields = {name: field for name, field in fields.items() if name in requested}
+        for name in omitted:
+            fields.pop(name, None)
+        return fields
+
+    def fieldset_prefix(self):
+        parts = []
+        node = self
+        while node.parent is not None:
+            if node.field_name:
+                parts.append(node.field_name)
+            node = node.parent
+        return ".".join(reversed(parts))
+
+    @staticmethod
+    def fieldset_level(paths, prefix, leaves_only=False):
+        """Names addressed at the level ``prefix`` points to."""
+        names = set()
+        for path in paths:
+            if prefix:
+                if not path.startswith(prefix + "."):
+                    continue
+                path = path[len(prefix) + 1:]
+            name, _, rest = path.partition(".")
+            if not (leaves_only and rest):
+                names.add(name)
+        return names
+
+
+class CategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = "__all__"
 
-class SubcategorySerializer(serializers.ModelSerializer):
+class SubcategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Subcategory
         fields = "__all__"
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all())
     subcategory = serializers.PrimaryKeyRelatedField(queryset=Subcategory.objects.all())
+    rating_histogram = serializers.SerializerMethodField()
 
 
     class Meta:
         model = Product
-        fields = "__all__"
+        exclude = ['rating_sum', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+        read_only_fields = ['rating_average', 'rating_count']
+
+    def get_rating_histogram(self, obj):
+        return {star: getattr(obj, f"rating_{star}") for star in range(1, 6)}
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ProductListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """Compact product representation used by list endpoints unless ``?fields=`` asks for more."""
+
+    class Meta:
+        model = Product
+        fields = ['id', 'sku', 'name', 'price', 'stock', 'category', 'subcategory',
+                  'rating_average', 'rating_count', 'created_at']
+
+class ReviewSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.username')
 
     class Meta:
         model = Review
         fields = "__all__"
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product = ProductSerializer()
+    line_subtotal = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
 
     class Meta:
         model = CartItem
-        fields = ['id', 'product', 'quantity','user']
+        fields = ['id', 'product', 'quantity','user','line_subtotal']
+
+
+
+
+class CartSummarySerializer(serializers.Serializer):
+    item_count = serializers.IntegerField()
+    total_quantity = serializers.IntegerField()
+    cart_total = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class GuestCartItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+
+class GuestCartSetItemSerializer(GuestCartItemSerializer):
+    # Setting a quantity of zero removes the product.
+    quantity = serializers.IntegerField(min_value=0)
+
+
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=["add", "set", "remove"])
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, data):
+        if data["op"] == "add":
+            data.setdefault("quantity", 1)
+        elif data["op"] == "set" and "quantity" not in data:
+            raise serializers.ValidationError({"quantity": "This field is required for set."})
+        return data
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=500)
+    remove_from_wishlist = serializers.BooleanField(default=False)
+
+
+class CouponPreviewSerializer(serializers.Serializer):
+    code = serializers.CharField()
+    order_total = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=0, required=False)
 
 
+class QuoteItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class QuoteRequestSerializer(serializers.Serializer):
+    items = QuoteItemSerializer(many=True, required=False, allow_null=True, default=None, max_length=500)
+    coupon_code = serializers.CharField(required=False, allow_blank=True, allow_null=True, default=None)
+    carrier_id = serializers.IntegerField(required=False, allow_null=True, default=None)
+
+    def validate_items(self, items):
+        if items is None:
+            return None
+        quantities = {}
+        for item in items:
+            quantities[item["product_id"]] = quantities.get(item["product_id"], 0) + item["quantity"]
+        return quantities
+
+
+class QuoteBatchSerializer(serializers.Serializer):
+    quotes = QuoteRequestSerializer(many=True, allow_empty=False, max_length=100)
+
+
+class QuoteLineSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    name = serializers.CharField()
+    unit_price = serializers.DecimalField(max_digits=12, decimal_places=2)
+    quantity = serializers.IntegerField()
+    line_total = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class QuoteSerializer(serializers.Serializer):
+    lines = QuoteLineSerializer(many=True)
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2)
+    discount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    shipping = serializers.DecimalField(max_digits=12, decimal_places=2)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2)
+    coupon_code = serializers.CharField(allow_null=True)
+    carrier_id = serializers.IntegerField(allow_null=True)
+    errors = serializers.ListField(child=serializers.CharField())
+
+
+class ShippingAddressSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ShippingAddress
+        fields = ['id','full_name','address_line1','address_line2','city','state','country','postal_code','phone_number']
+        # exclude = ['user']
+
+class OrderItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+
     class Meta:
         model = OrderItem
-        fields = ['id', 'product_name', 'quantity', 'price','payment_status']
+        fields = ['id', 'product', 'product_name', 'quantity', 'price','payment_status']
+
 
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True, read_only=True)
+    address = ShippingAddressSerializer(read_only=True)
+    shipping_carrier_name = serializers.CharField(source='shipping_carrier.name', read_only=True, default=None)
 
-class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
-        fields = ['id', 'user', 'total_price', 'status', 'created_at', 'items']
+        fields = ['id', 'user', 'total_price', 'discount_applied', 'status', 'payment_status', 'created_at',
+                  'address', 'shipping_carrier', 'shipping_carrier_name', 'tracking_number', 'tracking_url', 'items']
         read_only_fields = ['user', 'status', 'created_at']
 
-class WishlistSerializer(serializers.ModelSerializer):
+class WishlistSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     review = serializers.SerializerMethodField()
 
     class Meta:
@@ -60,28 +219,61 @@ class WishlistSerializer(serializers.ModelSerializer):
         latest_review = obj.product.reviews.order_by('-id').first()
         return latest_review.rating if latest_review else None
 
-class CouponSerializer(serializers.ModelSerializer):
+class CouponSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Coupon
         fields = "__all__"
 
-class ShippingAddressSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = ShippingAddress
-        fields = ['id','full_name','address_line1','address_line2','city','state','country','postal_code','phone_number']
-        # exclude = ['user']
-
-class TrackOrderSerializer(serializers.ModelSerializer):
+class TrackOrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['id', 'tracking_number', 'shipping_carrier', 'tracking_url']
 
-class UpdateOrderStatusSerializer(serializers.ModelSerializer):
+class UpdateOrderStatusSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['status']
+        extra_kwargs = {'status': {'required': True}}
 
-class ShippingCarrierSerializer(serializers.ModelSerializer):
+class BulkOrderStatusSerializer(serializers.Serializer):
+    order_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=10000)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+
+class ShippingCarrierSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = ShippingCarrier
-        fields = "__all__"
\ No newline at end of file
+        fields = "__all__"
+
+class ProductImportSerializer(serializers.Serializer):
+    """One row of a seller catalog import; category names are resolved from ``context["taxonomy"]``."""
+    sku = serializers.CharField(max_length=64)
+    name = serializers.CharField(max_length=255)
+    description = serializers.CharField(allow_blank=True, required=False, default="")
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    stock = serializers.IntegerField(min_value=0)
+    category = serializers.CharField()
+    subcategory = serializers.CharField()
+
+    def validate(self, data):
+        categories, subcategories = self.context["taxonomy"]
+        category_id = categories.get(data["category"].strip().lower())
+        if category_id is None:
+            raise serializers.ValidationError({"category": f"Unknown category '{data['category']}'."})
+        subcategory = subcategories.get(data["subcategory"].strip().lower())
+        if subcategory is None or subcategory[1] != category_id:
+            raise serializers.ValidationError(
+                {"subcategory": f"Unknown subcategory '{data['subcategory']}' for this category."})
+        data["category"] = category_id
+        data["subcategory"] = subcategory[0]
+        return data
+
+
+class InventoryItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    stock = serializers.IntegerField(min_value=0, required=False)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+
+    def validate(self, data):
+        if "stock" not in data and "price" not in data:
+            raise serializers.ValidationError("Provide stock, price or both.")
+        return data
@@ -0,0 +1,113 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import (bump_version, CATEGORY_NAMESPACE, CATEGORY_TREE_NAMESPACE, COUPON_NAMESPACE,
+                    PRODUCT_NAMESPACE, SHIPPING_CARRIER_NAMESPACE, SUBCATEGORY_NAMESPACE)
+from .facets import FACET_FIELDS, FACET_NAMESPACE, facet_state
+from .models import Category, Coupon, Order, Product, Review, ShippingCarrier, Subcategory
+from .ratings import apply_rating_change
+from .search import index_products
+from .tracking import refresh as refresh_tracking
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    index_products([instance.pk])
+
+
+@receiver(post_save, sender=Order)
+def refresh_order_tracking(sender, instance, raw=False, **kwargs):
+    # Bulk transitions use queryset updates and refresh the records themselves.
+    if raw or not instance.tracking_number:
+        return
+    refresh_tracking([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Subcategory)
+def reindex_taxonomy_products(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    lookup = "category" if sender is Category else "subcategory"
+    index_products(Product.objects.filter(**{lookup: instance}).values_list("pk", flat=True).iterator())
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if instance.pk and not raw:
+        instance._previous_rating = (
+            Review.objects.filter(pk=instance.pk).values_list("product_id", "rating").first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_previous_rating", None)
+    if previous is None:
+        apply_rating_change(instance.product_id, added=instance.rating)
+    elif previous[0] != instance.product_id:
+        apply_rating_change(previous[0], removed=previous[1])
+        apply_rating_change(instance.product_id, added=instance.rating)
+    elif previous[1] != instance.rating:
+        apply_rating_change(instance.product_id, added=instance.rating, removed=previous[1])
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    apply_rating_change(instance.product_id, removed=instance.rating)
+
+
+# Cache namespaces whose payloads depend on each model.
+CACHE_DEPENDENCIES = {
+    Product: (PRODUCT_NAMESPACE, FACET_NAMESPACE, CATEGORY_TREE_NAMESPACE),
+    Category: (CATEGORY_NAMESPACE, SUBCATEGORY_NAMESPACE, PRODUCT_NAMESPACE, FACET_NAMESPACE,
+               CATEGORY_TREE_NAMESPACE),
+    Subcategory: (CATEGORY_NAMESPACE, SUBCATEGORY_NAMESPACE, PRODUCT_NAMESPACE, FACET_NAMESPACE,
+                  CATEGORY_TREE_NAMESPACE),
+    # Reviews change the product rating aggregates through a queryset update.
+    Review: (PRODUCT_NAMESPACE,),
+    ShippingCarrier: (SHIPPING_CARRIER_NAMESPACE,),
+    Coupon: (COUPON_NAMESPACE,),
+}
+
+
+def invalidate_model_caches(model, keep=()):
+    """
+    Invalidate every cached payload that depends on ``model``, except the
+    namespaces in ``keep``; also used after bulk writes.
+    """
+    namespaces = [namespace for namespace in CACHE_DEPENDENCIES[model] if namespace not in keep]
+    # Bump after commit so a concurrent reader cannot re-cache pre-commit rows under the new version.
+    transaction.on_commit(lambda: bump_version(*namespaces))
+
+
+def invalidate_cached_payloads(sender, **kwargs):
+    invalidate_model_caches(sender)
+
+
+@receiver(pre_save, sender=Product)
+def remember_facet_state(sender, instance, raw=False, **kwargs):
+    instance._previous_facet_state = None
+    if instance.pk and not raw:
+        row = Product.objects.filter(pk=instance.pk).values_list(*FACET_FIELDS).first()
+        instance._previous_facet_state = facet_state(*row) if row else None
+
+
+@receiver(post_save, sender=Product)
+def invalidate_product_caches(sender, instance, **kwargs):
+    # Most saves (ratings, SKUs, small stock moves) leave every facet count as it was.
+    previous = getattr(instance, "_previous_facet_state", None)
+    current = facet_state(*(getattr(instance, field) for field in FACET_FIELDS))
+    invalidate_model_caches(Product, keep=(FACET_NAMESPACE,) if previous == current else ())
+
+
+for model in CACHE_DEPENDENCIES:
+    if model is not Product:
+        post_save.connect(invalidate_cached_payloads, sender=model, dispatch_uid=f"invalidate-{model.__name__}-save")
+    post_delete.connect(invalidate_cached_payloads, sender=model, dispatch_uid=f"invalidate-{model.__name__}-delete")
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.mail import send_mail
+from django.utils import timezone
+
+from .gateway import get_gateway
+from .jobs import task
+from .models import Order
+from .reservations import release_reservations
+
+
+@task(max_attempts=8, timeout=120)
+def process_stripe_event(event_id):
+    from .webhooks import PENDING, process_event
+
+    event = process_event(event_id)
+    # A handler failure reschedules the event itself; follow it.
+    if event is not None:
+        event.refresh_from_db(fields=["status", "available_at"])
+        if event.status == PENDING:
+            process_stripe_event.enqueue(event_id=event_id, run_at=event.available_at)
+
+
+@task(max_attempts=8, timeout=120)
+def refund_order(order_id):
+    """Refund a cancelled order's payment and return its stock. Safe to repeat."""
+    order = Order.objects.get(pk=order_id)
+    if order.payment_status != "refunded":
+        gateway = get_gateway()
+        payment_intent = gateway.retrieve_payment_intent(order.payment_intent_id)
+        if payment_intent.status == "succeeded":
+            gateway.create_refund(order.payment_intent_id, idempotency_key=f"refund-{order.pk}")
+            Order.objects.filter(pk=order.pk).update(payment_status="refunded", updated_at=timezone.now())
+    release_reservations(order, include_committed=True)
+
+
+@task(max_attempts=10)
+def send_order_confirmation(order_id):
+    order = Order.objects.select_related("user").get(pk=order_id)
+    send_mail(
+        f"Order #{order.pk} confirmed",
+        f"Thanks for your order. We have received your payment of {order.total_price} "
+        f"and will let you know when it ships.",
+        getattr(settings, "DEFAULT_FROM_EMAIL", None),
+        [order.user.email],
+    )
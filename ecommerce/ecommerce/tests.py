@@ -1,3 +1,1223 @@
-from django.test import TestCase
+import gzip
+import json
+import multiprocessing
+import os
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import stripe
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from utils.generate_tracking import IdGenerator, decode, generate_custom_id, generate_custom_ids
+
+from .cache import CATEGORY_TREE_NAMESPACE, PRODUCT_NAMESPACE, get_version
+from . import fake_stripe, guest_cart
+from .apps import check_id_generator_host
+from .bulk import export_rows, import_products
+from .facets import FACET_NAMESPACE
+from .fulfilment import transition_orders
+from .gateway import CircuitBreaker, FakeBackend, PaymentGateway, set_gateway
+from .inventory import sync_inventory
+from .jobs import DONE, FAILED, QUEUED, RUNNING, claim, run_job, task, work
+from .outbox import dispatch, enqueue_checkout_session
+from .pricing import Line, coupon_discount, price, quote_many, stripe_line_items, to_minor_units
+from .ratings import rebuild_ratings
+from .renderers import FastJSONRenderer
+from .tasks import refund_order
+from .views import CancelOrderAPIView
+from .webhooks import mark_paid
+from .models import (CartItem, Category, Coupon, Job, Order, OrderItem, PaymentOutbox, Product, Review,
+                     ShippingAddress, ShippingCarrier, StockReservation, Subcategory, Wishlist)
+from .reservations import (COMMITTED, HELD, RELEASED, InsufficientStock, commit_reservations, release_expired,
+                           release_reservations, reserve_stock)
+
+
+def make_user(email="buyer@example.com", **extra):
+    return User.objects.create_user(email=email, password="secret", first_name="Test", last_name="User",
+                                    role="buyer", **extra)
+
+
+def make_product(user, stock=10, price="10.00", name="Phone"):
+    category, _ = Category.objects.get_or_create(name="Electronics")
+    subcategory, _ = Subcategory.objects.get_or_create(name="Phones", category=category)
+    return Product.objects.create(name=name, user=user, description="A product", price=price, stock=stock,
+                                  category=category, subcategory=subcategory)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.product = make_product(self.user, stock=5)
+        self.order = Order.objects.create(user=self.user, total_price=0)
+
+    def test_reserve_takes_stock_and_holds_it(self):
+        reserve_stock(self.order, {self.product.pk: 3})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+        self.assertEqual(self.order.reservations.get().status, HELD)
+
+    def test_short_reservation_holds_nothing(self):
+        other = make_product(self.user, stock=1, name="Case")
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve_stock(self.order, {self.product.pk: 2, other.pk: 2})
+        self.assertEqual(raised.exception.product_ids, [other.pk])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_release_returns_stock_once(self):
+        reserve_stock(self.order, {self.product.pk: 3})
+        self.assertEqual(release_reservations(self.order), 1)
+        self.assertEqual(release_reservations(self.order), 0)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+    def test_expired_holds_are_swept(self):
+        reserve_stock(self.order, {self.product.pk: 3}, ttl=-1)
+        self.assertEqual(release_expired(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertEqual(self.order.reservations.get().status, RELEASED)
+
+    def test_commit_retakes_a_lapsed_hold(self):
+        reserve_stock(self.order, {self.product.pk: 3}, ttl=-1)
+        release_expired()
+        self.assertEqual(commit_reservations(self.order), [])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+        self.assertEqual(self.order.reservations.get().status, COMMITTED)
+
+    def test_commit_reports_stock_sold_in_the_meantime(self):
+        reserve_stock(self.order, {self.product.pk: 3}, ttl=-1)
+        release_expired()
+        reserve_stock(Order.objects.create(user=self.user, total_price=0), {self.product.pk: 4})
+        self.assertEqual(commit_reservations(self.order), [self.product.pk])
+
+    def test_refund_releases_committed_stock(self):
+        reserve_stock(self.order, {self.product.pk: 3})
+        commit_reservations(self.order)
+        self.assertEqual(release_reservations(self.order), 0)
+        self.assertEqual(release_reservations(self.order, include_committed=True), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+    def bumped(self, change):
+        namespaces = (PRODUCT_NAMESPACE, FACET_NAMESPACE, CATEGORY_TREE_NAMESPACE)
+        versions = [get_version(namespace) for namespace in namespaces]
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        return tuple(get_version(namespace) > version for namespace, version in zip(namespaces, versions))
+
+    def test_stock_changes_invalidate_cached_product_payloads(self):
+        self.assertEqual(self.bumped(lambda: reserve_stock(self.order, {self.product.pk: 1})), (True, False, False))
+        self.assertEqual(self.bumped(lambda: release_reservations(self.order)), (True, False, False))
+
+    def test_stock_crossing_zero_also_invalidates_facet_counts(self):
+        self.assertEqual(self.bumped(lambda: reserve_stock(self.order, {self.product.pk: 5})), (True, True, False))
+        self.assertEqual(self.bumped(lambda: release_reservations(self.order)), (True, True, False))
+
+
+class StockReservationConcurrencyTests(TransactionTestCase):
+    buyers = 12
+    stock = 5
+
+    def test_concurrent_checkouts_never_oversell(self):
+        user = make_user()
+        product = make_product(user, stock=self.stock)
+        orders = [Order.objects.create(user=user, total_price=0) for _ in range(self.buyers)]
+        start = threading.Event()
+        outcomes = []
+
+        def checkout(order):
+            start.wait()
+            try:
+                reserve_stock(order, {product.pk: 1})
+                outcomes.append(True)
+            except InsufficientStock:
+                outcomes.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(order,)) for order in orders]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(outcomes.count(True), self.stock)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(StockReservation.objects.filter(status=HELD).count(), self.stock)
+
+    def test_concurrent_release_and_sweep_return_stock_once(self):
+        user = make_user()
+        product = make_product(user, stock=self.stock)
+        orders = [Order.objects.create(user=user, total_price=0) for _ in range(self.stock)]
+        for order in orders:
+            reserve_stock(order, {product.pk: 1}, ttl=-1)
+        start = threading.Event()
+
+        def release(order):
+            start.wait()
+            try:
+                release_reservations(order)
+                release_expired()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=release, args=(order,)) for order in orders]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(product.stock, self.stock)
+        self.assertEqual(StockReservation.objects.filter(status=RELEASED).count(), self.stock)
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.product = make_product(self.user)
+        self.other = make_product(self.user, name="Case")
+
+    def review(self, rating, product=None):
+        return Review.objects.create(product=product or self.product, user=self.user, rating=rating, comment="")
+
+    def aggregates(self, product=None):
+        product = product or self.product
+        product.refresh_from_db()
+        return (product.rating_count, product.rating_sum, str(product.rating_average),
+                [getattr(product, f"rating_{star}") for star in range(1, 6)])
+
+    def test_create_edit_and_delete_keep_the_aggregates_current(self):
+        first = self.review(5)
+        self.review(2)
+        self.assertEqual(self.aggregates(), (2, 7, "3.50", [0, 1, 0, 0, 1]))
+        first.rating = 4
+        first.save()
+        self.assertEqual(self.aggregates(), (2, 6, "3.00", [0, 1, 0, 1, 0]))
+        first.delete()
+        self.assertEqual(self.aggregates(), (1, 2, "2.00", [0, 1, 0, 0, 0]))
+
+    def test_moving_a_review_to_another_product(self):
+        review = self.review(3)
+        review.product = self.other
+        review.save()
+        self.assertEqual(self.aggregates(), (0, 0, "0.00", [0, 0, 0, 0, 0]))
+        self.assertEqual(self.aggregates(self.other), (1, 3, "3.00", [0, 0, 1, 0, 0]))
+
+    def test_rebuild_matches_the_incremental_aggregates(self):
+        for rating in (1, 4, 4):
+            self.review(rating)
+        incremental = self.aggregates()
+        Product.objects.filter(pk=self.product.pk).update(rating_count=0, rating_sum=0, rating_average=0)
+        rebuild_ratings()
+        self.assertEqual(self.aggregates(), incremental)
+
+
+class CachedResponseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = make_product(self.user)
+        self.category = self.product.category
+
+    def names(self, client=None):
+        response = (client or self.client).get("/api/categories/")
+        self.assertEqual(response.status_code, 200)
+        return [category["name"] for category in response.json()["results"]]
+
+    def test_repeat_reads_are_served_from_the_cache(self):
+        self.names()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(), ["Electronics"])
+
+    def test_entries_are_shared_between_users(self):
+        self.names()
+        # A queryset update sends no signal, so only a shared entry still has the old name.
+        Category.objects.filter(pk=self.category.pk).update(name="Gadgets")
+        client = APIClient()
+        client.force_authenticate(make_user(email="other@example.com"))
+        self.assertEqual(self.names(client), ["Electronics"])
+
+    def test_save_invalidates_once_the_transaction_commits(self):
+        self.names()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.category.name = "Gadgets"
+            self.category.save()
+            # Until the commit another reader could still re-cache the old row, so nothing is bumped yet.
+            self.assertEqual(self.names(), ["Electronics"])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.names(), ["Gadgets"])
+
+    def test_product_save_invalidates_product_payloads(self):
+        url = f"/api/products/{self.product.pk}/"
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = "12.50"
+            self.product.save()
+        self.assertEqual(self.client.get(url).json()["price"], "12.50")
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.product = make_product(make_user(), stock=5)
+
+    def test_cached_body_matches_its_etag_after_signal_free_update(self):
+        first = self.client.get("/api/products/")
+        # A queryset update sends no signal, so the catalog cache is not invalidated.
+        Product.objects.filter(pk=self.product.pk).update(stock=1, updated_at=timezone.now() + timedelta(seconds=1))
+        second = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second["ETag"], first["ETag"])
+        self.assertEqual(second.json()["results"][0]["stock"], 1)
+        third = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=second["ETag"])
+        self.assertEqual(third.status_code, 304)
+
+    def test_users_share_one_cached_catalog_entry(self):
+        anonymous = self.client.get("/api/products/")
+        # Unseen by the validators: served from the shared entry only if there is one.
+        Product.objects.filter(pk=self.product.pk).update(name="Renamed")
+        client = APIClient()
+        client.force_authenticate(make_user(email="other@example.com"))
+        signed_in = client.get("/api/products/")
+        self.assertEqual(signed_in["ETag"], anonymous["ETag"])
+        self.assertEqual(signed_in.json()["results"][0]["name"], "Phone")
+        self.assertEqual(client.get("/api/products/", HTTP_IF_NONE_MATCH=anonymous["ETag"]).status_code, 304)
+
+    def test_detail_body_matches_its_etag(self):
+        url = f"/api/products/{self.product.pk}/"
+        first = self.client.get(url)
+        Product.objects.filter(pk=self.product.pk).update(price="12.00", updated_at=timezone.now() + timedelta(seconds=1))
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()["price"], "12.00")
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        user = make_user()
+        self.case = make_product(user, name="Leather Case")
+        self.stand = make_product(user, name="Desk Stand")
+        self.stand.description = "Holds a phone in any case"
+        self.stand.save()
+        self.charger = make_product(user, name="Charger")
+
+    def search(self, terms):
+        response = self.client.get("/api/products/", {"search": terms})
+        self.assertEqual(response.status_code, 200)
+        return [product["id"] for product in response.json()["results"]]
+
+    def test_title_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search("case"), [self.case.pk, self.stand.pk])
+
+    def test_every_token_must_match(self):
+        self.assertEqual(self.search("leather case"), [self.case.pk])
+        self.assertEqual(self.search("zebra"), [])
+
+    def test_prefixes_and_case_are_ignored(self):
+        self.assertEqual(self.search("CHARG"), [self.charger.pk])
+
+    def test_renamed_category_is_searchable(self):
+        category = Category.objects.get(name="Electronics")
+        category.name = "Gadgets"
+        category.save()
+        self.assertEqual(set(self.search("gadgets")), {self.case.pk, self.stand.pk, self.charger.pk})
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        user = make_user()
+        # Repeated prices so pages have to break ties on the id.
+        self.products = [make_product(user, price=f"{10 + i // 3}.00", name=f"Phone {i}") for i in range(7)]
+
+    def walk(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json())
+            url = pages[-1]["next"]
+        return pages
+
+    def ids(self, pages):
+        return [product["id"] for page in pages for product in page["results"]]
+
+    def test_cursor_walk_returns_every_row_once_in_order(self):
+        pages = self.walk("/api/products/?cursor=&ordering=price&page_size=3")
+        expected = [product.pk for product in sorted(self.products, key=lambda product: (product.price, product.pk))]
+        self.assertEqual(self.ids(pages), expected)
+        self.assertEqual([len(page["results"]) for page in pages], [3, 3, 1])
+        self.assertIsNone(pages[0]["previous"])
+        self.assertNotIn("count", pages[0])
+
+    def test_previous_link_returns_the_page_before(self):
+        pages = self.walk("/api/products/?cursor=&ordering=-price&page_size=3")
+        back = self.client.get(pages[2]["previous"]).json()
+        self.assertEqual(back["results"], pages[1]["results"])
+        first = self.client.get(back["previous"]).json()
+        self.assertEqual(first["results"], pages[0]["results"])
+        self.assertIsNone(first["previous"])
+
+    def test_default_ordering_is_newest_first(self):
+        pages = self.walk("/api/products/?cursor=&page_size=4")
+        self.assertEqual(self.ids(pages), [product.pk for product in reversed(self.products)])
+
+    def test_malformed_cursor_is_not_found(self):
+        self.assertEqual(self.client.get("/api/products/?cursor=not-a-cursor").status_code, 404)
+
+    def test_without_cursor_pages_are_numbered(self):
+        response = self.client.get("/api/products/?page_size=3")
+        self.assertEqual(response.json()["count"], 7)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = make_product(self.user)
+
+    def test_list_defaults_to_the_compact_representation(self):
+        product = self.client.get("/api/products/").json()["results"][0]
+        self.assertEqual(set(product), {"id", "sku", "name", "price", "stock", "category", "subcategory",
+                                        "rating_average", "rating_count", "created_at"})
+
+    def test_fields_trims_the_payload_and_the_columns_loaded(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/products/", {"fields": "id,name,rating_histogram"})
+        product = response.json()["results"][0]
+        self.assertEqual(set(product), {"id", "name", "rating_histogram"})
+        self.assertEqual(product["rating_histogram"], {"1": 0, "2": 0, "3": 0, "4": 0, "5": 0})
+        select = next(query["sql"] for query in queries if '"product"."rating_5"' in query["sql"])
+        self.assertNotIn('"product"."description"', select)
+
+    def test_omit_drops_fields_from_the_detail(self):
+        product = self.client.get(f"/api/products/{self.product.pk}/", {"omit": "description,rating_histogram"}).json()
+        self.assertNotIn("description", product)
+        self.assertNotIn("rating_histogram", product)
+        self.assertEqual(product["name"], "Phone")
+
+    def test_dotted_paths_reach_nested_serializers(self):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=2)
+        items = self.client.get("/api/cart/", {"fields": "quantity,product.name,product.price"}).json()["items"]
+        self.assertEqual(items, [{"quantity": 2, "product": {"name": "Phone", "price": "10.00"}}])
+
+
+class RenderingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        user = make_user()
+        for i in range(10):
+            make_product(user, name=f"Phone {i}")
+
+    def test_fast_renderer_matches_the_drf_encoder(self):
+        data = {"price": Decimal("10.50"), "at": timezone.now(), "wait": timedelta(minutes=5),
+                "label": gettext_lazy("Phone"), "line": "a b", 1: "one"}
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+        self.assertNotIn(" ".encode(), FastJSONRenderer().render(data))
+
+    def test_fast_parser_reads_request_bodies(self):
+        client = APIClient()
+        client.force_authenticate(make_user(email="other@example.com"))
+        product = Product.objects.first()
+        response = client.post("/api/cart/batch/", {"operations": [{"op": "add", "product_id": product.pk, "quantity": 2}]}, format="json")
+        self.assertEqual(response.json()["total_quantity"], 2)
+        self.assertEqual(client.post("/api/cart/batch/", "{", content_type="application/json").status_code, 400)
+
+    def test_large_bodies_are_gzipped_with_a_weak_etag(self):
+        plain = self.client.get("/api/products/")
+        response = self.client.get("/api/products/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(response["ETag"], "W/" + plain["ETag"].removeprefix("W/"))
+        self.assertEqual(json.loads(gzip.decompress(response.content)), plain.json())
+
+    def test_small_bodies_are_sent_as_is(self):
+        response = self.client.get("/api/products/", {"fields": "id"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertLess(len(response.content), 1024)
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+
+class CartTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.phone = make_product(self.user, price="199.99")
+        self.case = make_product(self.user, price="15.50", name="Case")
+
+    def add(self, product, quantity):
+        CartItem.objects.create(user=self.user, product=product, quantity=quantity)
+
+    def test_cart_and_totals_take_two_queries_whatever_the_size(self):
+        self.add(self.phone, 1)
+        self.add(self.case, 3)
+        for i in range(5):
+            self.add(make_product(self.user, price="1.00", name=f"Cable {i}"), 1)
+        with self.assertNumQueries(2):
+            cart = self.client.get("/api/cart/").json()
+        self.assertEqual([item["line_subtotal"] for item in cart["items"][:2]], ["199.99", "46.50"])
+        self.assertEqual((cart["item_count"], cart["total_quantity"], cart["cart_total"]), (7, 9, "251.49"))
+
+    def test_summary_is_one_aggregate(self):
+        self.add(self.case, 2)
+        with self.assertNumQueries(1):
+            summary = self.client.get("/api/cart/summary/").json()
+        self.assertEqual(summary, {"item_count": 1, "total_quantity": 2, "cart_total": "31.00"})
+
+    def test_empty_cart_totals_are_zero(self):
+        self.assertEqual(self.client.get("/api/cart/summary/").json(),
+                         {"item_count": 0, "total_quantity": 0, "cart_total": "0.00"})
+
+    def test_other_users_lines_are_not_counted(self):
+        self.add(self.case, 1)
+        CartItem.objects.create(user=make_user(email="other@example.com"), product=self.phone, quantity=4)
+        cart = self.client.get("/api/cart/").json()
+        self.assertEqual([item["product"]["id"] for item in cart["items"]], [self.case.pk])
+        self.assertEqual(cart["cart_total"], "15.50")
+
+
+class CartBatchTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.phone = make_product(self.user)
+        self.case = make_product(self.user, name="Case")
+        self.cable = make_product(self.user, name="Cable")
+
+    def batch(self, *operations, **extra):
+        return self.client.post("/api/cart/batch/", {"operations": list(operations), **extra}, format="json")
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(user=self.user).values_list("product_id", "quantity"))
+
+    def test_operations_apply_in_order_to_one_line_per_product(self):
+        CartItem.objects.create(user=self.user, product=self.phone, quantity=2)
+        CartItem.objects.create(user=self.user, product=self.cable, quantity=1)
+        response = self.batch(
+            {"op": "add", "product_id": self.phone.pk, "quantity": 3},
+            {"op": "set", "product_id": self.case.pk, "quantity": 4},
+            {"op": "add", "product_id": self.case.pk},
+            {"op": "add", "product_id": self.cable.pk},
+            {"op": "remove", "product_id": self.cable.pk},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.phone.pk: 5, self.case.pk: 5})
+        self.assertEqual(response.json()["total_quantity"], 10)
+
+    def test_writes_do_not_grow_with_the_batch(self):
+        others = [make_product(self.user, name=f"Cable {i}") for i in range(20)]
+        with CaptureQueriesContext(connection) as queries:
+            self.batch(*[{"op": "add", "product_id": product.pk} for product in others],
+                       {"op": "set", "product_id": self.case.pk, "quantity": 2},
+                       {"op": "remove", "product_id": self.phone.pk})
+        writes = [query for query in queries if query["sql"].startswith(("INSERT", "UPDATE", "DELETE"))]
+        self.assertEqual(len(writes), 3)
+        self.assertEqual(len(self.quantities()), 21)
+
+    def test_unknown_product_rejects_the_whole_batch(self):
+        response = self.batch({"op": "add", "product_id": self.phone.pk}, {"op": "add", "product_id": 0})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["product_ids"], [0])
+        self.assertEqual(self.quantities(), {})
+
+    def test_added_products_can_leave_the_wishlist(self):
+        for product in (self.phone, self.case):
+            Wishlist.objects.create(user=self.user, product=product)
+        self.batch({"op": "add", "product_id": self.phone.pk}, remove_from_wishlist=True)
+        self.assertEqual(list(Wishlist.objects.values_list("product_id", flat=True)), [self.case.pk])
+
+    def test_single_add_upserts_the_existing_line(self):
+        self.client.post("/api/cart/add/", {"product_id": self.phone.pk, "quantity": 2}, format="json")
+        self.client.post("/api/cart/add/", {"product_id": self.phone.pk, "quantity": 1}, format="json")
+        self.assertEqual(self.quantities(), {self.phone.pk: 3})
+
+
+class FacetInvalidationTests(TestCase):
+    def setUp(self):
+        self.product = make_product(make_user(), stock=5, price="100.00")
+
+    def save(self, **fields):
+        for field, value in fields.items():
+            setattr(self.product, field, value)
+        versions = get_version(PRODUCT_NAMESPACE), get_version(FACET_NAMESPACE)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        return get_version(PRODUCT_NAMESPACE) > versions[0], get_version(FACET_NAMESPACE) > versions[1]
+
+    def test_save_that_moves_no_count_keeps_facets(self):
+        self.assertEqual(self.save(sku="PH-1", stock=4, price="120.00"), (True, False))
+
+    def test_save_that_moves_a_count_bumps_facets(self):
+        self.assertEqual(self.save(price="600.00"), (True, True))
+        self.assertEqual(self.save(stock=0), (True, True))
+        self.assertEqual(self.save(name="Smartphone"), (True, True))
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.phone = make_product(self.user, price="199.99")
+        self.case = make_product(self.user, price="15.50", name="Case")
+        self.carrier = ShippingCarrier.objects.create(name="Express", price="40.00", delivery_time="2 days")
+        self.coupon = self.make_coupon("TENOFF", "percent", "10.00", max_discount="25.00")
+
+    def make_coupon(self, code, discount_type, value, **extra):
+        coupon = Coupon.objects.create(code=code, discount_type=discount_type, discount_value=value,
+                                       valid_from=timezone.now() - timedelta(days=1),
+                                       valid_to=timezone.now() + timedelta(days=1), **extra)
+        return Coupon.objects.get(pk=coupon.pk)
+
+    def test_price_adds_lines_discount_and_shipping(self):
+        lines = [Line(self.phone.pk, "Phone", Decimal("199.99"), 2), Line(self.case.pk, "Case", Decimal("15.50"), 1)]
+        quote = price(lines, self.coupon, self.carrier)
+        self.assertEqual(quote.subtotal, Decimal("415.48"))
+        self.assertEqual(quote.discount, Decimal("25.00"))  # 10% capped at max_discount
+        self.assertEqual(quote.shipping, Decimal("40.00"))
+        self.assertEqual(quote.total, Decimal("430.48"))
+        self.assertEqual(quote.errors, [])
+
+    def test_coupon_discount_rules(self):
+        self.assertEqual(coupon_discount(self.coupon, Decimal("33.33")), (Decimal("3.33"), None))
+        fixed = self.make_coupon("FLAT50", "fixed", "50.00", min_order_value="20.00")
+        self.assertEqual(coupon_discount(fixed, Decimal("30.00")), (Decimal("30.00"), None))
+        self.assertEqual(coupon_discount(fixed, Decimal("10.00")),
+                         (Decimal("0.00"), "Order total is too low for this coupon"))
+        fixed.valid_to = timezone.now() - timedelta(hours=1)
+        self.assertEqual(coupon_discount(fixed, Decimal("30.00")), (Decimal("0.00"), "Coupon expired or invalid"))
+
+    def test_quote_many_prices_each_request_and_reports_errors(self):
+        CartItem.objects.create(user=self.user, product=self.case, quantity=2)
+        quotes = quote_many([
+            {"items": {self.phone.pk: 1}, "coupon_code": "TENOFF", "carrier_id": self.carrier.pk},
+            {},
+            {"items": {self.phone.pk: 1, 999999: 1}, "coupon_code": "NOPE", "carrier_id": 999999},
+        ], user=self.user)
+        self.assertEqual([quote.total for quote in quotes], [Decimal("219.99"), Decimal("31.00"), Decimal("199.99")])
+        self.assertEqual(quotes[2].errors,
+                         ["Products not found: [999999]", "Invalid coupon code", "Invalid shipping carrier"])
+
+    def test_quote_many_query_count_does_not_grow_with_the_batch(self):
+        request = {"items": {self.phone.pk: 1}, "coupon_code": "TENOFF", "carrier_id": self.carrier.pk}
+        with self.assertNumQueries(4):
+            quote_many([request] * 50 + [{}], user=self.user)
+
+    def test_stripe_line_items_add_up_to_the_total(self):
+        lines = [Line(self.phone.pk, "Phone", Decimal("199.99"), 3)]
+        for coupon in (None, self.coupon):
+            quote = price(lines, coupon, self.carrier)
+            items = stripe_line_items(quote, order_id=1)
+            self.assertEqual(sum(item["price_data"]["unit_amount"] * item["quantity"] for item in items),
+                             to_minor_units(quote.total))
+
+    def test_quote_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post("/api/pricing/quotes/", {"quotes": [
+            {"items": [{"product_id": self.case.pk, "quantity": 2}], "carrier_id": self.carrier.pk},
+        ]}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["quotes"][0]["total"], "71.00")
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.order = Order.objects.create(user=self.user, total_price=0)
+        self.url = f"/api/orders/{self.order.pk}/cancel/"
+
+    def cancel(self, key, data=None, client=None):
+        return (client or self.client).put(self.url, data or {}, format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.cancel("cancel-1")
+        self.assertEqual(first.status_code, 200)
+        self.assertNotIn("Idempotent-Replayed", first)
+        retry = self.cancel("cancel-1")
+        # Run again, the handler would answer "already cancelled" with a 400.
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(self.cancel("cancel-2").status_code, 400)
+
+    def test_key_reused_for_a_different_request_is_rejected(self):
+        self.cancel("cancel-1")
+        mismatch = self.cancel("cancel-1", {"reason": "changed my mind"})
+        self.assertEqual(mismatch.status_code, 422)
+
+    def test_keys_are_scoped_to_the_user(self):
+        self.cancel("cancel-1")
+        other = APIClient()
+        other.force_authenticate(make_user(email="other@example.com"))
+        response = self.cancel("cancel-1", client=other)
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("Idempotent-Replayed", response)
+
+    def test_overlong_key_is_rejected(self):
+        self.assertEqual(self.cancel("k" * 256).status_code, 400)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "pending")
+
+
+class CancelOrderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = make_product(self.user, stock=5)
+        self.order = Order.objects.create(user=self.user, total_price=0)
+        reserve_stock(self.order, {self.product.pk: 2})
+        self.url = f"/api/orders/{self.order.pk}/cancel/"
+
+    def stock(self):
+        self.product.refresh_from_db()
+        return self.product.stock
+
+    def test_unpaid_order_is_cancelled_and_its_stock_released(self):
+        self.assertEqual(self.client.put(self.url).status_code, 200)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, "cancelled")
+        self.assertEqual(self.stock(), 5)
+
+    def test_payment_landing_mid_cancel_is_a_conflict(self):
+        read = CancelOrderAPIView.get_object
+
+        def read_then_pay(view):
+            order = read(view)
+            mark_paid(Order.objects.get(pk=order.pk), "pi_1")
+            return order
+
+        with mock.patch.object(CancelOrderAPIView, "get_object", read_then_pay):
+            response = self.client.put(self.url, HTTP_IDEMPOTENCY_KEY="cancel-1")
+        self.assertEqual(response.status_code, 409)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.payment_status), ("processing", "paid"))
+        # The paid order keeps its stock instead of having it released under the payment.
+        self.assertEqual(self.stock(), 3)
+        # Conflicts are not replayed, so the retry cancels the paid order and refunds it.
+        self.assertEqual(self.client.put(self.url, HTTP_IDEMPOTENCY_KEY="cancel-1").status_code, 202)
+        self.assertEqual(list(Job.objects.filter(task=refund_order.name).values_list("payload", flat=True)),
+                         [{"order_id": self.order.pk}])
+
+
+class BulkOrderTransitionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.product = make_product(self.user, stock=5)
+
+    def make_order(self, status="pending", **fields):
+        return Order.objects.create(user=self.user, total_price=0, status=status, **fields)
+
+    def test_results_follow_the_state_machine_in_request_order(self):
+        pending, processing, delivered = (self.make_order(status) for status in ("pending", "processing", "delivered"))
+        results = transition_orders([processing.pk, 999999, delivered.pk, pending.pk, processing.pk], "shipped")
+        self.assertEqual([result["ok"] for result in results], [True, False, False, False])
+        self.assertEqual(results[1]["error"], "Order not found.")
+        self.assertEqual(results[2]["error"], "Cannot move an order from delivered to shipped.")
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, "pending")
+
+    def test_shipping_assigns_unique_tracking_numbers_and_keeps_existing_ones(self):
+        orders = [self.make_order("processing") for _ in range(3)] + [
+            self.make_order("processing", tracking_number="KEEP-1")]
+        with self.captureOnCommitCallbacks(execute=True):
+            results = transition_orders([order.pk for order in orders], "shipped")
+        numbers = [result["tracking_number"] for result in results]
+        self.assertEqual(numbers[3], "KEEP-1")
+        self.assertEqual(len(set(numbers)), 4)
+        self.assertEqual(set(Order.objects.values_list("tracking_number", flat=True)), set(numbers))
+        self.assertEqual(self.client.get(f"/api/track/{numbers[0]}/").json()["status"], "shipped")
+
+    def test_cancel_refunds_paid_orders_and_releases_unpaid_stock(self):
+        unpaid, paid = self.make_order(), self.make_order(payment_status="paid", payment_intent_id="pi_1")
+        reserve_stock(unpaid, {self.product.pk: 2})
+        transition_orders([unpaid.pk, paid.pk], "cancelled")
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertEqual(list(Job.objects.filter(task=refund_order.name).values_list("payload", flat=True)),
+                         [{"order_id": paid.pk}])
+
+    def test_bulk_endpoint_is_admin_only_and_reports_counts(self):
+        orders = [self.make_order("processing"), self.make_order("cancelled")]
+        client = APIClient()
+        client.force_authenticate(self.user)
+        body = {"order_ids": [order.pk for order in orders], "status": "shipped"}
+        self.assertEqual(client.post("/api/update-order-status/bulk/", body, format="json").status_code, 403)
+        client.force_authenticate(make_user(email="admin@example.com", is_staff=True))
+        response = client.post("/api/update-order-status/bulk/", body, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["updated"], response.json()["failed"]), (1, 1))
+
+
+class TrackingLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        carrier = ShippingCarrier.objects.create(name="Express", price="40.00", delivery_time="2 days")
+        self.order = Order.objects.create(user=make_user(), total_price=0, status="processing",
+                                          shipping_carrier=carrier, tracking_number="TRK-1")
+
+    def track(self, number="TRK-1"):
+        return self.client.get(f"/api/track/{number}/")
+
+    def test_lookup_is_public_and_shows_no_customer_data(self):
+        response = self.track()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {"tracking_number", "status", "carrier", "delivery_time",
+                                                "tracking_url", "updated_at"})
+        self.assertEqual((response.json()["status"], response.json()["carrier"]), ("processing", "Express"))
+
+    def test_repeat_lookups_are_served_from_the_cache(self):
+        self.track()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.track().status_code, 200)
+
+    def test_unknown_numbers_are_remembered_until_an_order_takes_them(self):
+        self.assertEqual(self.track("TRK-2").status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.track("TRK-2").status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(user=self.order.user, total_price=0, tracking_number="TRK-2")
+        self.assertEqual(self.track("TRK-2").status_code, 200)
+
+    def test_status_changes_rewrite_the_cached_record(self):
+        self.track()
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_orders([self.order.pk], "shipped")
+        self.assertEqual(self.track().json()["status"], "shipped")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.refresh_from_db()
+            self.order.status = "delivered"
+            self.order.save()
+        self.assertEqual(self.track().json()["status"], "delivered")
+
+
+class OrderHistoryQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.carrier = ShippingCarrier.objects.create(name="Express", price="40.00", delivery_time="2 days")
+        self.address = ShippingAddress.objects.create(
+            user=self.user, full_name="Test User", address_line1="1 Main St", city="Pune", state="MH",
+            country="IN", postal_code="411001", phone_number="9999999999",
+        )
+
+    def add_orders(self, count, items):
+        for _ in range(count):
+            order = Order.objects.create(user=self.user, total_price=0, address=self.address,
+                                         shipping_carrier=self.carrier)
+            for index in range(items):
+                OrderItem.objects.create(order=order, product=make_product(self.user, name=f"Item {index}"),
+                                         quantity=1, price="10.00")
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_order_list_query_count_does_not_grow_with_orders_or_items(self):
+        self.add_orders(1, items=1)
+        baseline = self.queries("/api/orders/")
+        self.add_orders(6, items=4)
+        with self.assertNumQueries(baseline):
+            response = self.client.get("/api/orders/")
+        self.assertEqual(len(response.json()["results"]), 7)
+        self.assertEqual(sum(len(order["items"]) for order in response.json()["results"]), 25)
+
+    def test_order_detail_query_count_does_not_grow_with_items(self):
+        self.add_orders(1, items=1)
+        order = Order.objects.get()
+        baseline = self.queries(f"/api/orders/{order.pk}/")
+        for index in range(5):
+            OrderItem.objects.create(order=order, product=make_product(self.user, name=f"Extra {index}"),
+                                     quantity=2, price="5.00")
+        with self.assertNumQueries(baseline):
+            self.client.get(f"/api/orders/{order.pk}/")
+
+
+class InventorySyncTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.product = make_product(self.user, stock=5, price="10.00")
+
+    def test_items_for_the_same_id_merge_by_field(self):
+        results = sync_inventory([{"id": self.product.pk, "stock": 7}, {"id": self.product.pk, "price": "9.99"}],
+                                 Product.objects.all())
+        self.assertEqual([result["status"] for result in results], ["updated", "updated"])
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, str(self.product.price)), (7, "9.99"))
+
+    def test_later_item_supersedes_only_the_fields_it_sets(self):
+        results = sync_inventory([
+            {"id": self.product.pk, "stock": 7, "price": "8.00"},
+            {"id": self.product.pk, "stock": 3},
+            {"id": self.product.pk, "price": "9.00"},
+        ], Product.objects.all())
+        self.assertEqual([result["status"] for result in results], ["superseded", "updated", "updated"])
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, str(self.product.price)), (3, "9.00"))
+
+    def test_unknown_and_invalid_items_are_reported(self):
+        other = make_product(make_user("other@example.com"), stock=1)
+        results = sync_inventory([{"id": other.pk, "stock": 2}, {"id": self.product.pk, "stock": -1}],
+                                 Product.objects.filter(user=self.user))
+        self.assertEqual([result["status"] for result in results], ["not_found", "invalid"])
+
+
+class AbsoluteStockWriteTests(TestCase):
+    """Counts on hand written while units are held must not be inflated when the hold is released."""
+
+    def setUp(self):
+        self.seller = make_user("seller@example.com")
+        self.product = make_product(self.seller, stock=10)
+        Product.objects.filter(pk=self.product.pk).update(sku="PH-1")
+        self.order = Order.objects.create(user=make_user(), total_price=0)
+        reserve_stock(self.order, {self.product.pk: 3})
+
+    def assertStockAfterRelease(self, held, released):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, held)
+        release_reservations(self.order)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, released)
+
+    def test_inventory_sync_during_a_hold(self):
+        sync_inventory([{"id": self.product.pk, "stock": 8}], Product.objects.all())
+        self.assertStockAfterRelease(5, 8)
+
+    def test_product_update_during_a_hold(self):
+        client = APIClient()
+        client.force_authenticate(self.seller)
+        response = client.patch(f"/api/products/{self.product.pk}/", {"stock": 8}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertStockAfterRelease(5, 8)
+
+    def test_export_and_import_round_trip_during_a_hold(self):
+        rows = list(export_rows(self.seller))
+        self.assertEqual(rows[0]["stock"], 10)
+        report = import_products(self.seller, enumerate(rows, start=2))
+        self.assertEqual((report.updated, report.errors), (1, []))
+        self.assertStockAfterRelease(7, 10)
+
+
+class ProductExportTests(TestCase):
+    def test_export_requires_authentication(self):
+        self.assertEqual(APIClient().get("/api/products/export/").status_code, 401)
+
+    def test_export_streams_the_sellers_products(self):
+        seller = make_user("seller@example.com")
+        make_product(seller, name="Mine")
+        make_product(make_user(), name="Theirs")
+        client = APIClient()
+        client.force_authenticate(seller)
+        response = client.get("/api/products/export/")
+        self.assertEqual(response.status_code, 200)
+        body = b"".join(response.streaming_content).decode()
+        self.assertIn("Mine", body)
+        self.assertNotIn("Theirs", body)
+
+
+class GuestCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.product = make_product(self.user)
+
+    def test_adding_zero_is_rejected(self):
+        response = APIClient().post("/api/guest-cart/", {"product_id": self.product.pk, "quantity": 0}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_merge_skips_non_positive_quantities(self):
+        other = make_product(self.user, name="Case")
+        token = guest_cart.new_token()
+        guest_cart.save(token, {self.product.pk: 2, other.pk: 0})
+        self.assertEqual(guest_cart.merge_guest_cart(self.user, token), 1)
+        self.assertEqual(list(CartItem.objects.values_list("product_id", "quantity")), [(self.product.pk, 2)])
+
+
+def _generate_ids(args):
+    count, block = args
+    if block:
+        return [custom_id for _ in range(0, count, block) for custom_id in generate_custom_ids(block)]
+    return [generate_custom_id() for _ in range(count)]
+
+
+class IdGeneratorTests(TestCase):
+    def test_ids_ascend_and_decode(self):
+        generator = IdGenerator(host=7, process=42)
+        ids = [generator.next_id() for _ in range(100)] + generator.block(10000)
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), len(ids))
+        _, host, process, sequence = decode(ids[0])
+        self.assertEqual((host, process, sequence), (7, 42, 0))
+
+    def test_processes_never_collide(self):
+        # Forked workers each build their own generator, keyed by their pid.
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            streams = pool.map(_generate_ids, [(20000, 0), (20000, 0), (20000, 500), (20000, 500)])
+        ids = [custom_id for stream in streams for custom_id in stream]
+        self.assertEqual(len(set(ids)), len(ids))
+        for stream in streams:
+            self.assertEqual(stream, sorted(stream))
+
+    def test_deployments_must_set_the_host(self):
+        with override_settings(DEBUG=False), mock.patch.dict(os.environ, {"ID_GENERATOR_HOST": ""}):
+            with self.assertRaises(ImproperlyConfigured):
+                check_id_generator_host()
+        with override_settings(DEBUG=True), mock.patch.dict(os.environ, {"ID_GENERATOR_HOST": ""}):
+            check_id_generator_host()
+        with override_settings(DEBUG=False), mock.patch.dict(os.environ, {"ID_GENERATOR_HOST": "12"}):
+            check_id_generator_host()
+            self.assertEqual(IdGenerator().host, 12)
+
+    def test_out_of_range_host_is_rejected(self):
+        for value in ("1024", "-1", "web-1"):
+            with mock.patch.dict(os.environ, {"ID_GENERATOR_HOST": value}), self.assertRaises(ImproperlyConfigured):
+                check_id_generator_host()
+
+
+class TrackingNumberMigrationTests(TransactionTestCase):
+    before = [("ecommerce", "0023_job_queue")]
+    after = [("ecommerce", "0024_order_tracking_number_unique")]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicate_tracking_numbers_are_reassigned(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        Order = apps.get_model("ecommerce", "Order")
+        user = apps.get_model("accounts", "User").objects.create(email="legacy@example.com", first_name="L",
+                                                                 last_name="U", role="buyer")
+        kept, duplicate, blank, other = [
+            Order.objects.create(user_id=user.pk, total_price=1, tracking_number=number)
+            for number in ("ID/1/AAAAAA", "ID/1/AAAAAA", "", "")
+        ]
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.after)
+        Order = executor.loader.project_state(self.after).apps.get_model("ecommerce", "Order")
+        numbers = dict(Order.objects.values_list("pk", "tracking_number"))
+        self.assertEqual(numbers[kept.pk], "ID/1/AAAAAA")
+        self.assertNotIn(numbers[duplicate.pk], (None, "ID/1/AAAAAA"))
+        self.assertEqual((numbers[blank.pk], numbers[other.pk]), (None, None))
+
+
+recorded = []
+
+
+@task(name="tests.record", max_attempts=2)
+def record(value):
+    recorded.append(value)
+
+
+@task(name="tests.explode", max_attempts=2)
+def explode():
+    raise RuntimeError("boom")
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        recorded.clear()
+
+    def test_bad_arguments_fail_at_enqueue(self):
+        with self.assertRaises(TypeError):
+            record.enqueue(colour="red")
+        self.assertFalse(Job.objects.exists())
+
+    def test_work_runs_due_jobs_once(self):
+        done = record.enqueue(value=1)
+        later = record.enqueue(value=2, run_at=timezone.now() + timedelta(hours=1))
+        self.assertEqual(work(worker="w1", drain=True), 1)
+        self.assertEqual(work(worker="w1", drain=True), 0)
+        self.assertEqual(recorded, [1])
+        done.refresh_from_db()
+        later.refresh_from_db()
+        self.assertEqual((done.status, done.attempts, later.status), (DONE, 1, QUEUED))
+
+    def test_failures_back_off_then_give_up(self):
+        job = explode.enqueue()
+        with self.assertLogs("ecommerce.jobs", "ERROR"):
+            work(worker="w1", drain=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.last_error), (QUEUED, 1, "boom"))
+        self.assertGreater(job.run_at, timezone.now())
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs("ecommerce.jobs", "ERROR"):
+            work(worker="w1", drain=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (FAILED, 2))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_lapsed_claim_is_taken_over_and_the_stale_result_dropped(self):
+        record.enqueue(value=1)
+        [stale] = claim("w1")
+        Job.objects.filter(pk=stale.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        [current] = claim("w2")
+        self.assertEqual((current.attempts, current.locked_by), (2, "w2"))
+        run_job(stale)
+        self.assertEqual(Job.objects.get(pk=stale.pk).status, RUNNING)
+        self.assertTrue(run_job(current))
+        self.assertEqual(Job.objects.get(pk=stale.pk).status, DONE)
+
+    def test_claim_on_the_last_attempt_fails_a_lapsed_job(self):
+        job = record.enqueue(value=1)
+        Job.objects.filter(pk=job.pk).update(status=RUNNING, attempts=2, locked_until=timezone.now())
+        self.assertEqual(claim("w1"), [])
+        self.assertEqual(Job.objects.get(pk=job.pk).status, FAILED)
+
+    def test_unknown_task_fails_without_retrying(self):
+        job = Job.objects.create(task="tests.missing")
+        with self.assertLogs("ecommerce.jobs", "ERROR"):
+            self.assertFalse(run_job(claim("w1")[0]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (FAILED, 1))
+
+
+class MarkPaidTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.product = make_product(self.user, stock=5)
+        self.order = Order.objects.create(user=self.user, total_price=10)
+        reserve_stock(self.order, {self.product.pk: 2})
+
+    def test_payment_commits_stock_and_queues_confirmation(self):
+        self.assertTrue(mark_paid(self.order, "pi_1"))
+        self.assertFalse(mark_paid(self.order, "pi_1"))
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.payment_status), ("processing", "paid"))
+        self.assertEqual(self.order.reservations.get().status, COMMITTED)
+        self.assertEqual(list(Job.objects.values_list("task", flat=True)), ["ecommerce.tasks.send_order_confirmation"])
+
+    def test_payment_for_a_cancelled_order_is_refunded(self):
+        Order.objects.filter(pk=self.order.pk).update(status="cancelled")
+        release_reservations(self.order)
+        self.assertFalse(mark_paid(self.order, "pi_1"))
+        self.order.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.payment_status), ("cancelled", "paid"))
+        self.assertEqual(self.product.stock, 5)
+        self.assertEqual(self.order.reservations.get().status, RELEASED)
+        self.assertEqual(list(Job.objects.values_list("task", "payload")),
+                         [("ecommerce.tasks.refund_order", {"order_id": self.order.pk})])
+
+    def test_payment_poll_sees_the_payment_despite_a_repeated_idempotency_key(self):
+        Order.objects.filter(pk=self.order.pk).update(session_id="cs_1")
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = "/api/payment-success/?session_id=cs_1"
+        self.assertEqual(client.patch(url, HTTP_IDEMPOTENCY_KEY="poll-1").status_code, 202)
+        mark_paid(self.order, "pi_1")
+        self.assertEqual(client.patch(url, HTTP_IDEMPOTENCY_KEY="poll-1").status_code, 200)
+
+
+class OutboxCircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        set_gateway(PaymentGateway(FakeBackend(), max_retries=0, breaker=self.breaker))
+        self.addCleanup(set_gateway, None)
+        self.addCleanup(fake_stripe.reset)
+        user = make_user()
+        order = Order.objects.create(user=user, total_price=10)
+        reserve_stock(order, {make_product(user).pk: 1})
+        self.message = enqueue_checkout_session(order, [], "https://example.com/ok", "https://example.com/no", {})
+
+    def test_open_breaker_leaves_the_message_unclaimed(self):
+        self.breaker.record_failure()
+        self.assertIsNone(dispatch(self.message.pk))
+        self.message.refresh_from_db()
+        self.assertEqual((self.message.status, self.message.attempts), ("pending", 0))
+
+    def test_short_circuited_attempt_is_not_counted(self):
+        PaymentOutbox.objects.filter(pk=self.message.pk).update(attempts=7)
+        # Half open with another trial call in flight: the gateway refuses without calling Stripe.
+        self.breaker.record_failure()
+        self.breaker.opened_at -= 60
+        self.breaker.trial_in_flight = True
+        dispatch(self.message.pk)
+        self.message.refresh_from_db()
+        self.assertEqual((self.message.status, self.message.attempts), ("pending", 7))
+
+    def test_dispatch_creates_the_session_once_the_breaker_closes(self):
+        dispatch(self.message.pk)
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.status, "sent")
+        self.assertTrue(self.message.order.session_id)
+
+
+class LostResponseBackend(FakeBackend):
+    """Creates the session upstream, then loses the first response on the way back."""
+
+    def __init__(self):
+        self.calls = []
+
+    def create_checkout_session(self, timeout, idempotency_key=None, **params):
+        self.calls.append((idempotency_key, params))
+        session = super().create_checkout_session(timeout, idempotency_key=idempotency_key, **params)
+        if len(self.calls) == 1:
+            raise stripe.error.APIConnectionError("Connection reset")
+        return session
+
+
+class OutboxRetryTests(TestCase):
+    def test_retry_after_a_lost_response_resends_identical_params(self):
+        backend = LostResponseBackend()
+        set_gateway(PaymentGateway(backend, max_retries=0))
+        self.addCleanup(set_gateway, None)
+        self.addCleanup(fake_stripe.reset)
+        user = make_user()
+        order = Order.objects.create(user=user, total_price=10)
+        reserve_stock(order, {make_product(user).pk: 1})
+        message = enqueue_checkout_session(order, [], "https://example.com/ok", "https://example.com/no", {})
+
+        dispatch(message.pk)
+        # The retry runs minutes later, when a freshly computed expiry would differ.
+        with mock.patch("django.utils.timezone.now", return_value=timezone.now() + timedelta(minutes=5)):
+            dispatch(message.pk)
+
+        self.assertEqual(len(backend.calls), 2)
+        self.assertEqual(backend.calls[0], backend.calls[1])
+        message.refresh_from_db()
+        order.refresh_from_db()
+        self.assertEqual((message.status, order.status), ("sent", "pending"))
+        self.assertTrue(order.session_id)
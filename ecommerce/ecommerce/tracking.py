@@ -0,0 +1,62 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Order
+
+# What the public lookup shows; nothing here identifies the customer.
+FIELDS = ("tracking_number", "status", "shipping_carrier__name", "shipping_carrier__delivery_time",
+          "tracking_url", "updated_at")
+# Cached in place of a record for numbers that match no order.
+MISSING = "missing"
+
+
+def get_cache():
+    return caches[getattr(settings, "TRACKING_CACHE_ALIAS", "default")]
+
+
+def _key(tracking_number):
+    return f"tracking:{hashlib.md5(tracking_number.encode()).hexdigest()}"
+
+
+def _record(row):
+    tracking_number, status, carrier, delivery_time, tracking_url, updated_at = row
+    return {
+        "tracking_number": tracking_number,
+        "status": status,
+        "carrier": carrier,
+        "delivery_time": delivery_time,
+        "tracking_url": tracking_url,
+        "updated_at": updated_at.isoformat(),
+    }
+
+
+def lookup(tracking_number):
+    """
+    The public tracking record for ``tracking_number``, or ``None``. Served
+    from the cache; a miss is one query on the unique tracking number index.
+    """
+    cache = get_cache()
+    record = cache.get(_key(tracking_number))
+    if record is None:
+        row = Order.objects.filter(tracking_number=tracking_number).values_list(*FIELDS).first()
+        record = _record(row) if row else MISSING
+        timeout = (getattr(settings, "TRACKING_CACHE_TIMEOUT", 60 * 60 * 24) if row
+                   else getattr(settings, "TRACKING_MISSING_CACHE_TIMEOUT", 60))
+        cache.set(_key(tracking_number), record, timeout)
+    return None if record == MISSING else record
+
+
+def refresh(order_ids):
+    """Rewrite the cached records of ``order_ids`` from the database, once the current transaction commits."""
+    order_ids = list(order_ids)
+
+    def write():
+        rows = Order.objects.filter(pk__in=order_ids, tracking_number__isnull=False).values_list(*FIELDS)
+        records = {_key(row[0]): _record(row) for row in rows}
+        if records:
+            get_cache().set_many(records, getattr(settings, "TRACKING_CACHE_TIMEOUT", 60 * 60 * 24))
+
+    transaction.on_commit(write)
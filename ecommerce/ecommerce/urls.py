@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (ProductViewSet, ReviewViewSet,CategoryViewset, SubcategoryViewset,AddToCartView,
-                    ViewCartView, UpdateCartView, RemoveFromCartView, ClearCartView,CheckoutAPIView,
+                    ViewCartView, UpdateCartView, RemoveFromCartView, ClearCartView,CheckoutAPIView, CheckoutSessionView,
                     UserOrdersAPIView,OrderDetailAPIView,CancelOrderAPIView,Wishlist,PaymentCancelAPIView
                     ,CouponViewSet,ApplyCouponView,AvailableCouponsView,ShippingAddressViewSet,ShippingMethodsView,TrackOrderView,
-                    UpdateOrderStatusView,PaymentStatusAPIView,ShippingCarrierViewset)
+                    UpdateOrderStatusView,BulkOrderStatusView,TrackingLookupView,PaymentStatusAPIView,ShippingCarrierViewset,CatalogBrowseView,
+                    CartSummaryView,GuestCartView,CartBatchView,QuoteBatchView,StripeWebhookView,PaymentGatewayStatsView)
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet,basename="products")
@@ -28,22 +29,33 @@ urlpatterns = [
     # path('admin/categories/<int:pk>/', CategoryDetailView.as_view(), name='category-detail'),
     # path('admin/subcategories/', SubcategoryManagementView.as_view(), name='subcategory-admin'),
     # path('admin/subcategories/<int:pk>/', SubcategoryDetailView.as_view(), name='subcategory-detail'),
+    path('catalog/', CatalogBrowseView.as_view(), name='catalog'),
     path('cart/add/', AddToCartView.as_view(), name='add-to-cart'),
     path('cart/', ViewCartView.as_view(), name='view-cart'),
+    path('cart/summary/', CartSummaryView.as_view(), name='cart-summary'),
+    path('cart/batch/', CartBatchView.as_view(), name='cart-batch'),
+    path('guest-cart/', GuestCartView.as_view(), name='guest-cart'),
     path('cart/update/<int:item_id>/', UpdateCartView.as_view(), name='update-cart'),
     path('cart/remove/<int:item_id>/', RemoveFromCartView.as_view(), name='remove-from-cart'),
     path('cart/clear/', ClearCartView.as_view(), name='clear-cart'),
     path("checkout/", CheckoutAPIView.as_view(), name="checkout"),
+    path("checkout/<int:pk>/", CheckoutSessionView.as_view(), name="checkout-session"),
     path("orders/", UserOrdersAPIView.as_view(), name="user-orders"),
     path("orders/<int:pk>/", OrderDetailAPIView.as_view(), name="order-detail"),
     path("orders/<int:pk>/cancel/", CancelOrderAPIView.as_view(), name="cancel-order"),
     path('payment-success/', PaymentStatusAPIView.as_view(), name='payment-success'),
     path('payment-cancel/', PaymentCancelAPIView.as_view(), name='payment-cancel'),
+    path('payments/webhook/', StripeWebhookView.as_view(), name='stripe-webhook'),
+    path('admin/payment-gateway/', PaymentGatewayStatsView.as_view(), name='payment-gateway-stats'),
     path('apply-coupon/', ApplyCouponView.as_view(), name="apply_coupon"),
+    path('pricing/quotes/', QuoteBatchView.as_view(), name="pricing-quotes"),
     path('available-discounts/', AvailableCouponsView.as_view(), name="available_discounts"),
     path('shipping-methods/', ShippingMethodsView.as_view(), name='shipping-methods'),
     path('track-order/<int:order_id>/', TrackOrderView.as_view(), name='track-order'),
+    # Tracking numbers from before the current generator contain slashes.
+    path('track/<path:tracking_number>/', TrackingLookupView.as_view(), name='tracking-lookup'),
     path('update-order-status/<int:order_id>/', UpdateOrderStatusView.as_view(), name='update-order-status'),
+    path('update-order-status/bulk/', BulkOrderStatusView.as_view(), name='bulk-order-status'),
 
 
 
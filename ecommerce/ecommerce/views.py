@@ -5,54 +5,195 @@ from rest_framework import viewsets, generics
 from rest_framework.pagination import PageNumberPagination
 from .models import Product, Review,Category,Subcategory,CartItem,Order,OrderItem,Wishlist,Coupon,ShippingAddress,ShippingCarrier
 from rest_framework.permissions import IsAuthenticated, AllowAny,IsAdminUser
+from rest_framework.throttling import ScopedRateThrottle
 from .permissions import IsOwnerOrReadOnly
+from .filters import ProductSearchFilter, ProductFacetFilter
+from .facets import get_facet_counts, parse_facet_params
+from .catalog import get_category_tree
+from .bulk import detect_format, import_products, iter_rows, stream_export
+from .inventory import INVENTORY_SYNC_MAX_ITEMS, sync_inventory
+from .conditional import ConditionalGetMixin, make_etag, not_modified_response, set_validators
+from .cart import add_quantities, apply_cart_operations, cart_items, cart_summary
+from .gateway import get_gateway
+from .idempotency import idempotent
+from .outbox import dispatch, enqueue_checkout_session
+from .pricing import cart_lines, price, quote_many, stripe_line_items
+from .reservations import InsufficientStock, net_of_holds, release_expired, release_reservations, reserve_stock
+from .fulfilment import CANCELLABLE_STATUSES, can_transition, transition_orders
+from .tasks import refund_order
+from .webhooks import InvalidEvent, record_event
+from . import tracking
+from . import guest_cart
+from .pagination import CursorOptInPagination
+from .cache import (CachedResponseMixin, PRODUCT_NAMESPACE, CATEGORY_NAMESPACE, SUBCATEGORY_NAMESPACE,
+                    SHIPPING_CARRIER_NAMESPACE, COUPON_NAMESPACE)
 from .serializers import (ProductSerializer, ReviewSerializer, CategorySerializer, SubcategorySerializer,
                           WishlistSerializer,OrderSerializer, CartItemSerializer,CouponSerializer,ShippingAddressSerializer,
-                          TrackOrderSerializer,UpdateOrderStatusSerializer,ShippingCarrierSerializer)
+                          TrackOrderSerializer,UpdateOrderStatusSerializer,ShippingCarrierSerializer,
+                          ProductListSerializer,CartSummarySerializer,GuestCartItemSerializer,GuestCartSetItemSerializer,
+                          CartBatchSerializer,
+                          CouponPreviewSerializer,QuoteBatchSerializer,QuoteSerializer,BulkOrderStatusSerializer,
+                          parse_fieldset)
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from django.http import StreamingHttpResponse
 from rest_framework import filters
 from django.db import transaction
-import stripe
-from django.conf import settings
+from django.db.models import Prefetch
+from django.utils import timezone
 from django.urls import reverse
 from decimal import Decimal
-from utils.generate_tracking  import generate_custom_id
 
-class ProductPagination(PageNumberPagination):
+class ProductPagination(CursorOptInPagination):
     page_size = 10
     page_size_query_param = "page_size"
     max_page_size = 100
 
-class ProductViewSet(viewsets.ModelViewSet):
+class CompactProductListMixin:
+    """
+    Product lists default to ``ProductListSerializer`` and load only its
+    columns. ``?fields=``/``?omit=`` switch to the full serializer trimmed to the
+    requested fields, still deferring every column it does not need.
+    """
+    list_columns = ['id', 'sku', 'name', 'price', 'stock', 'category', 'subcategory',
+                    'rating_average', 'rating_count', 'created_at']
+    histogram_columns = ['rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+
+    def is_product_list(self):
+        return self.request.method == 'GET' and getattr(self, 'action', 'list') == 'list'
+
+    def has_fieldset(self):
+        return 'fields' in self.request.query_params or 'omit' in self.request.query_params
+
+    def get_serializer_class(self):
+        if self.is_product_list() and not self.has_fieldset():
+            return ProductListSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if not self.is_product_list():
+            return queryset
+        columns = set(self.list_columns)
+        if self.has_fieldset():
+            concrete = {field.name for field in Product._meta.concrete_fields}
+            requested = {name.split('.')[0] for name in parse_fieldset(self.request.query_params.get('fields'))}
+            if not requested:
+                omitted = {name for name in parse_fieldset(self.request.query_params.get('omit')) if '.' not in name}
+                requested = (concrete | {'rating_histogram'}) - omitted
+            if 'rating_histogram' in requested:
+                columns.update(self.histogram_columns)
+            columns.update(requested & concrete)
+        return queryset.only(*columns)
+
+class ProductViewSet(ConditionalGetMixin, CompactProductListMixin, CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all().order_by('-created_at')
     serializer_class = ProductSerializer
-    filter_backends = [filters.SearchFilter,filters.OrderingFilter]
-    search_fields = ['name','category__name']
-    ordering_fields = ['price', 'name','stock']
+    cache_namespace = PRODUCT_NAMESPACE
+    etag_varies_by_user = False
+    filter_backends = [ProductFacetFilter,ProductSearchFilter,filters.OrderingFilter]
+    ordering_fields = ['price', 'name','stock','rating_average','rating_count']
     pagination_class = ProductPagination
     permission_classes = [IsOwnerOrReadOnly]
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # Sellers send the count on hand; units held by unpaid orders stay out of the stored stock.
+            if "stock" in serializer.validated_data:
+                pk = serializer.instance.pk
+                serializer.validated_data["stock"] = net_of_holds({pk: serializer.validated_data["stock"]})[pk]
+            serializer.save()
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """Upsert the seller's products from an uploaded CSV or JSONL file keyed on ``sku``."""
+        upload = request.FILES.get("file")
+        if not upload:
+            return Response({"error": "file is required"}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.data.get("file_format") or detect_format(upload.name)
+        if fmt not in ("csv", "jsonl"):
+            return Response({"error": "file_format must be csv or jsonl"}, status=status.HTTP_400_BAD_REQUEST)
+        report = import_products(request.user, iter_rows(upload, fmt))
+        return Response(report.as_dict(), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def export(self, request):
+        """Stream the seller's catalog as CSV (default) or JSONL (``?file_format=jsonl``)."""
+        # ``format`` is reserved by DRF for renderer negotiation.
+        fmt = request.query_params.get("file_format", "csv")
+        if fmt not in ("csv", "jsonl"):
+            return Response({"error": "file_format must be csv or jsonl"}, status=status.HTTP_400_BAD_REQUEST)
+        content_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+        response = StreamingHttpResponse(stream_export(request.user, fmt), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="products.{fmt}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='inventory-sync')
+    def inventory_sync(self, request):
+        """Apply a batch of ``{id, stock, price}`` changes in one transaction."""
+        items = request.data.get("items") if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list):
+            return Response({"error": "items must be a list"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > INVENTORY_SYNC_MAX_ITEMS:
+            return Response({"error": f"At most {INVENTORY_SYNC_MAX_ITEMS} items per batch"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        queryset = Product.objects.all()
+        if not request.user.is_staff:
+            queryset = queryset.filter(user=request.user)
+        results = sync_inventory(items, queryset)
+        updated = sum(1 for result in results if result["status"] == "updated")
+        return Response({"updated": updated, "results": results}, status=status.HTTP_200_OK)
+
+class CatalogBrowseView(CompactProductListMixin, CachedResponseMixin, generics.ListAPIView):
+    """Faceted product browse: filtered results plus cached per-facet counts."""
+    queryset = Product.objects.all().order_by('-created_at')
+    serializer_class = ProductSerializer
+    cache_namespace = PRODUCT_NAMESPACE
+    filter_backends = [ProductFacetFilter,ProductSearchFilter,filters.OrderingFilter]
+    ordering_fields = ['price', 'name','stock','rating_average','rating_count']
+    pagination_class = ProductPagination
+    permission_classes = [IsOwnerOrReadOnly]
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        search = ProductSearchFilter()
+        searched = search.filter_queryset(request, self.get_queryset(), self)
+        facets = get_facet_counts(searched, parse_facet_params(request.query_params), search.get_search_terms(request))
+        if isinstance(response.data, dict):
+            response.data["facets"] = facets
+        else:
+            response.data = {"results": response.data, "facets": facets}
+        return response
     # def get_permissions(self):
     #     if self.action in ["create", "update", "partial_update", "destroy"]:
     #         return [permissions.IsAdminUser()]
     #     return [permissions.AllowAny()]
 
 # List all categories
-class CategoryViewset(viewsets.ModelViewSet):
+class CategoryViewset(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    cache_namespace = CATEGORY_NAMESPACE
     permission_classes = [IsAuthenticated]
 
     @action(detail=True, methods=['get'])
     def subcategories(self, request, pk=None):
         """Retrieve subcategories based on the parent category."""
-        category = self.get_object()
-        subcategories = Subcategory.objects.filter(category=category)
-        serializer = SubcategorySerializer(subcategories, many=True)
-        return Response(serializer.data)
+        def render():
+            category = self.get_object()
+            subcategories = Subcategory.objects.filter(category=category)
+            serializer = SubcategorySerializer(subcategories, many=True, context={'request': request})
+            return Response(serializer.data)
+        return self.cached_response(request, render)
+
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """All categories with nested subcategories and product counts."""
+        return Response(get_category_tree())
 
 # Retrieve subcategories for a given category
 # class SubcategoryListView(viewsets.ModelViewSet):
@@ -79,9 +220,10 @@ class CategoryViewset(viewsets.ModelViewSet):
 #     serializer_class = SubcategorySerializer
 #     permission_classes = [permissions.IsAdminUser]
 
-class SubcategoryViewset(viewsets.ModelViewSet):
+class SubcategoryViewset(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Subcategory.objects.all()
     serializer_class = SubcategorySerializer
+    cache_namespace = SUBCATEGORY_NAMESPACE
     permission_classes = [IsOwnerOrReadOnly]
 
     def get_queryset(self):
@@ -95,7 +237,8 @@ class ReviewViewSet(viewsets.ModelViewSet):
     serializer_class = ReviewSerializer
 
     def get_queryset(self):
-        return Review.objects.filter(product_id=self.kwargs["product_pk"])
+        product_id = self.kwargs.get("product_pk", self.request.query_params.get("product"))
+        return Review.objects.filter(product_id=product_id).order_by('-created_at')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -109,30 +252,111 @@ class AddToCartView(APIView):
         product_id = request.data.get("product_id")
         quantity = int(request.data.get("quantity",1))
 
-        product = Product.objects.get(id=product_id)
-
-        cart_item, created = CartItem.objects.get_or_create(product_id=product_id,user=user,quantity=quantity)
-        if not created:
+        product = get_object_or_404(Product, id=product_id)
 
-            cart_item.quantity += quantity
-            cart_item.save()
+        # Single upsert: creates the line or increments the existing one.
+        add_quantities(user, {product.id: quantity})
 
         return Response({"message": "Item added to cart"}, status=status.HTTP_201_CREATED)
 
+class CartBatchView(APIView):
+    """
+    Apply many ``add``/``set``/``remove`` cart operations atomically, e.g. a
+    reorder or moving the wishlist into the cart, in one round trip.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data["operations"]
+        product_ids = {operation["product_id"] for operation in operations}
+        missing = product_ids - set(Product.objects.filter(pk__in=product_ids).values_list("pk", flat=True))
+        if missing:
+            return Response({"error": "Products not found", "product_ids": sorted(missing)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            effects = apply_cart_operations(request.user, operations)
+            if serializer.validated_data["remove_from_wishlist"]:
+                added = [product_id for product_id, (kind, n) in effects.items() if n]
+                # ``Wishlist`` is shadowed by the viewset below, so go through the user relation.
+                request.user.Wishlist.filter(product_id__in=added).delete()
+        summary = CartSummarySerializer(cart_summary(request.user)).data
+        return Response({"message": "Cart updated", **summary}, status=status.HTTP_200_OK)
+
 class ViewCartView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        cart = CartItem.objects.filter(user=request.user)
-        serializer = CartItemSerializer(cart,many=True)
-        return Response(serializer.data)
+        cart = cart_items(request.user)
+        serializer = CartItemSerializer(cart,many=True,context={'request': request})
+        summary = CartSummarySerializer(cart_summary(request.user)).data
+        return Response({"items": serializer.data, **summary})
+
+class CartSummaryView(APIView):
+    """Badge data only: line count, unit count and total, from one aggregate query."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(CartSummarySerializer(cart_summary(request.user)).data)
+
+class GuestCartView(APIView):
+    """
+    Cart for anonymous shoppers, kept in the cache under the token sent as
+    ``X-Guest-Cart-Token``. It is merged into the persistent cart on login.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        token = guest_cart.get_guest_cart_token(request)
+        items = guest_cart.load(token) if token else {}
+        products = Product.objects.in_bulk(list(items))
+        lines = [
+            (products[product_id], quantity, products[product_id].price * quantity)
+            for product_id, quantity in items.items() if product_id in products
+        ]
+        return Response({
+            "guest_cart_token": token,
+            "items": [
+                {"product": ProductListSerializer(product).data, "quantity": quantity, "line_subtotal": str(subtotal)}
+                for product, quantity, subtotal in lines
+            ],
+            "item_count": len(lines),
+            "cart_total": str(sum((subtotal for _, _, subtotal in lines), Decimal("0.00"))),
+        })
+
+    def post(self, request):
+        """Add ``quantity`` of a product, issuing a token for the first item."""
+        serializer = GuestCartItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if not Product.objects.filter(pk=serializer.validated_data["product_id"]).exists():
+            return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+        token = guest_cart.get_guest_cart_token(request) or guest_cart.new_token()
+        items = guest_cart.add_item(token, serializer.validated_data["product_id"], serializer.validated_data["quantity"])
+        return Response({"guest_cart_token": token, "items": items}, status=status.HTTP_201_CREATED)
+
+    def patch(self, request):
+        """Set a product's quantity; zero removes it."""
+        token = guest_cart.get_guest_cart_token(request)
+        if not token:
+            return Response({"error": "Guest cart token is required"}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = GuestCartSetItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = guest_cart.set_item(token, serializer.validated_data["product_id"], serializer.validated_data["quantity"])
+        return Response({"guest_cart_token": token, "items": items})
+
+    def delete(self, request):
+        token = guest_cart.get_guest_cart_token(request)
+        if token:
+            guest_cart.clear(token)
+        return Response({"message": "Cart cleared"}, status=status.HTTP_204_NO_CONTENT)
 
 class UpdateCartView(APIView):
     permission_classes = [IsAuthenticated]
 
     def patch(self, request, item_id):
         try:
-            cart_item = CartItem.objects.get(id=item_id, cart__user=request.user)
+            cart_item = CartItem.objects.get(id=item_id, user=request.user)
             cart_item.quantity = request.data.get("quantity", cart_item.quantity)
             cart_item.save()
             return Response({"message": "Cart updated"}, status=status.HTTP_200_OK)
@@ -161,16 +385,15 @@ class ClearCartView(APIView):
 
 
 
-stripe.api_key = settings.STRIPE_SECRET_KEY  # Ensure this is set in settings.py
-
 class CheckoutAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         user = request.user
-        cart_items = CartItem.objects.filter(user=user)
+        lines = cart_lines(user)
 
-        if not cart_items.exists():
+        if not lines:
             return Response({"error": "Cart is empty"}, status=400)
 
         # Get coupon code from request data (if available)
@@ -179,7 +402,6 @@ class CheckoutAPIView(APIView):
         carrier_id = request.data.get("carrier_id", None)
         shipping_carrier = None
         address = None
-        discount_applied = Decimal('0.00')
         coupon = None
         if address_id:
             address = get_object_or_404(ShippingAddress,id=address_id)
@@ -187,79 +409,66 @@ class CheckoutAPIView(APIView):
             return Response({"error": "Address is invalid"}, status=400)
         if carrier_id:
             shipping_carrier = get_object_or_404(ShippingCarrier,id=carrier_id)
-            print(shipping_carrier)
         else:
             return Response({"error": "shipping_carrier is invalid"}, status=400)
         if code:
-            # Validate coupon code
             coupon = get_object_or_404(Coupon, code=code, is_active=True)
-            if not coupon.is_valid():
-                return Response({"error": "Coupon expired or invalid"}, status=400)
-
-            # Calculate the discount
-            cart_total = sum(item.product.price * item.quantity for item in cart_items)
-            if cart_total < coupon.min_order_value:
-                return Response({"error": "Order total is too low for this coupon"}, status=400)
-
-            discount_applied = coupon.discount_value
-            if coupon.discount_type == "percent":
-                discount_applied = (cart_total * coupon.discount_value) / Decimal('100')
-                if coupon.max_discount:
-                    discount_applied = min(discount_applied, coupon.max_discount)
-
-            # Apply the discount to the total price
-            total_price = cart_total - discount_applied
-            print({"After Discount":total_price})
-        else:
-            total_price = sum(item.product.price * item.quantity for item in cart_items)
-            print({"Without Discount": total_price})
-        unit_amount = int(total_price*100)
-        with transaction.atomic():
-            # Create order
-            # address = ShippingAddress.objects.filter(user=user).first()
-            order = Order.objects.create(
-                user=user,
-                total_price=total_price,
-                discount_applied=discount_applied,
-                coupon=coupon if code else None,
-                address = address,
-                shipping_carrier = shipping_carrier
-            )
-
-            line_items = []
-            for item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item.product,
-                    quantity=item.quantity,
-                    price=total_price
+        quote = price(lines, coupon, shipping_carrier)
+        if quote.errors:
+            return Response({"error": quote.errors[0]}, status=400)
+        quantities = {line.product_id: line.quantity for line in lines}
+        # Holds that lapsed on these products go back on sale before we try to take them.
+        release_expired(list(quantities))
+        # Only local writes happen in this transaction; Stripe is called after it
+        # commits, so no connection or product row is held across the network call.
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(
+                    user=user,
+                    total_price=quote.total,
+                    discount_applied=quote.discount,
+                    coupon=coupon,
+                    address = address,
+                    shipping_carrier = shipping_carrier
                 )
+                OrderItem.objects.bulk_create(
+                    OrderItem(order=order, product_id=line.product_id, quantity=line.quantity, price=line.unit_price)
+                    for line in lines
+                )
+                reserve_stock(order, quantities)
+                message = enqueue_checkout_session(
+                    order,
+                    stripe_line_items(quote, order.id),
+                    success_url=request.build_absolute_uri(reverse('payment-success')) + "?session_id={CHECKOUT_SESSION_ID}",
+                    cancel_url=request.build_absolute_uri(reverse('payment-cancel')),
+                    metadata={"order_id": order.id, "code": code},
+                )
+                CartItem.objects.filter(user=user).delete()  # Clear cart after checkout
+        except InsufficientStock as e:
+            return Response({"error": "Insufficient stock", "product_ids": e.product_ids}, status=status.HTTP_409_CONFLICT)
+
+        # First attempt inline; if Stripe is slow or down the process_payment_outbox
+        # worker retries and the client polls checkout/<order_id>/.
+        dispatch(message.pk)
+        return checkout_session_response(order)
+
+
+def checkout_session_response(order):
+    order.refresh_from_db(fields=["session_id", "checkout_url", "status", "payment_status"])
+    if order.session_id:
+        return Response({"checkout_url": order.checkout_url, "order_id": order.id, "session_id": order.session_id},
+                        status=status.HTTP_201_CREATED)
+    if order.payment_status == "failed":
+        return Response({"error": "Payment session could not be created", "order_id": order.id},
+                        status=status.HTTP_502_BAD_GATEWAY)
+    return Response({"order_id": order.id, "status": "pending"}, status=status.HTTP_202_ACCEPTED)
 
-                line_items.append({
-                    "price_data": {
-                        "currency": "inr",
-                        "product_data": {
-                            "name": item.product.name,
-                        },
-                        "unit_amount": unit_amount ,  # Convert to cents
-                    },
-                    "quantity": item.quantity,
-                })
-
-            # Create Stripe Checkout Session
-            session = stripe.checkout.Session.create(
-                payment_method_types=["card"],
-                line_items=line_items,
-                mode="payment",
-                success_url=request.build_absolute_uri(reverse('payment-success')) + "?session_id={CHECKOUT_SESSION_ID}",
-                cancel_url=request.build_absolute_uri(reverse('payment-cancel')),
-                metadata={"order_id": order.id,"code":code}
-            )
-            order.session_id = session.id
-            order.save()
-            cart_items.delete()  # Clear cart after checkout
-
-        return Response({"checkout_url": session.url, "order_id": order.id,"session_id":session.id}, status=201)
+
+class CheckoutSessionView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        return checkout_session_response(get_object_or_404(Order, pk=pk, user=request.user))
 from django.shortcuts import render
 
 
@@ -284,6 +493,7 @@ class PaymentStatusAPIView(generics.UpdateAPIView):
     queryset = OrderItem.objects.all()
     permission_classes = [IsAuthenticated]
 
+    # A read-only poll: not @idempotent, whose replay of a stored 202 would hide the payment landing.
     def patch(self, request, *args, **kwargs):
         session_id = request.query_params.get("session_id")
         if not session_id:
@@ -295,57 +505,71 @@ class PaymentStatusAPIView(generics.UpdateAPIView):
         except Order.DoesNotExist:
             return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        # Retrieve Stripe session details
-        session = stripe.checkout.Session.retrieve(session_id)
-        order_id = session.metadata.get("order_id")
-        if session.payment_status == "paid":
-            # print(f"Before saving: {order.payment_status}, {order.status},{self.queryset.get(order_id=order_id)}")
-
-            order.payment_status = "paid"
-            order.payment_intent_id = session.payment_intent
-            order.status = "processing"
-            order_item = OrderItem.objects.filter(order_id=order_id).first()
-
-            if order_item:
-                order_item.payment_status = True  # Assuming payment_status is a BooleanField
-                order_item.save()
-                print("OrderItem updated successfully!")
-            else:
-                print(f"OrderItem for order_id={order_id} not found!")
-            # self.queryset.payment_status = True
-            # Ensure the status is in allowed choices
-            # valid_statuses = [choice[0] for choice in Order.STATUS_CHOICES]
-            # print(f"Valid statuses: {valid_statuses}")
-            #
-            #
-            #
-            # if order.status not in list(Order.STATUS_CHOICES):
-            #     raise ValueError(f"Invalid status: {order.status}")
-            order.save()
-            # OrderItem.objects.get_or_create(order_id = order_id,payment_status=True)
+        # Payment state is written by the Stripe webhook worker (see webhooks.py);
+        # polling only reads it back and never calls Stripe.
+        if order.payment_status == "paid":
             return Response({"message": "Payment successful, order is processing"}, status=status.HTTP_200_OK)
-
+        if order.payment_status == "pending" and order.status != "cancelled":
+            return Response({"message": "Waiting for payment confirmation", "payment_status": order.payment_status},
+                            status=status.HTTP_202_ACCEPTED)
         return Response({"error": "Payment not completed"}, status=status.HTTP_400_BAD_REQUEST)
 
+
+class PaymentGatewayStatsView(APIView):
+    """Circuit breaker state and per-operation Stripe call metrics for this process."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_gateway().stats())
+
+
+class StripeWebhookView(APIView):
+    """
+    Stripe webhook receiver. Deliveries are verified, stored and acknowledged
+    straight away; a ``run_jobs`` worker applies them.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        try:
+            event, created = record_event(request.body, request.META.get("HTTP_STRIPE_SIGNATURE"))
+        except InvalidEvent as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"received": True, "duplicate": not created}, status=status.HTTP_200_OK)
+
 class PaymentCancelAPIView(APIView):
     permission_classes = [AllowAny]
     def get(self, request):
         # Render the cancel page
         return render(request, "cancel.html")
 
-class UserOrdersAPIView(generics.ListAPIView):
+class OrderHistoryMixin:
+    """
+    A customer's orders with everything ``OrderSerializer`` renders loaded
+    up front: the address and carrier joined, and the line items with their
+    product names in one prefetch, whatever the page size. Newest first,
+    which the ``(user, created_at, id)`` index serves without a sort.
+    """
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
-
-class OrderDetailAPIView(generics.RetrieveAPIView):
-    serializer_class = OrderSerializer
-    permission_classes = [IsAuthenticated]
-
-    def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        items = OrderItem.objects.select_related('product').only(
+            'id', 'order_id', 'product_id', 'product__name', 'quantity', 'price', 'payment_status'
+        ).order_by('id')
+        return (
+            Order.objects.filter(user=self.request.user)
+            .select_related('address', 'shipping_carrier')
+            .prefetch_related(Prefetch('items', queryset=items))
+            .order_by('-created_at', '-id')
+        )
+
+class UserOrdersAPIView(OrderHistoryMixin, ConditionalGetMixin, generics.ListAPIView):
+    pass
+
+class OrderDetailAPIView(OrderHistoryMixin, ConditionalGetMixin, generics.RetrieveAPIView):
+    pass
 
 class CancelOrderAPIView(generics.UpdateAPIView):
     serializer_class = OrderSerializer
@@ -354,23 +578,31 @@ class CancelOrderAPIView(generics.UpdateAPIView):
     def get_queryset(self):
         return Order.objects.filter(user=self.request.user)
 
+    @idempotent
     def update(self, request, *args, **kwargs):
         order = self.get_object()
         if order.status == "shipped":
             return Response({"message": "Order unable to cancel as it already shipped."}, status=status.HTTP_400_BAD_REQUEST)
         if order.status == "cancelled":
             return Response({"message": "Order was already cancelled."}, status=status.HTTP_400_BAD_REQUEST)
+        if not can_transition(order.status, "cancelled"):
+            return Response({"message": f"A {order.status} order cannot be cancelled."}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            # Only if nothing moved the order since it was read: a payment landing in between
+            # changes payment_status and must be refunded, not have its stock released.
+            cancelled = Order.objects.filter(
+                pk=order.pk, status__in=CANCELLABLE_STATUSES, payment_status=order.payment_status,
+            ).update(status="cancelled", updated_at=timezone.now())
+            if not cancelled:
+                return Response({"message": "Order changed while it was being cancelled. Please try again."},
+                                status=status.HTTP_409_CONFLICT)
+            if order.payment_intent_id:
+                # The refund, and the stock it frees, are settled by a worker.
+                refund_order.enqueue(order_id=order.pk)
         if order.payment_intent_id:
-            try:
-                payment_intent = stripe.PaymentIntent.retrieve(order.payment_intent_id)
-
-                if payment_intent.status == "succeeded":
-                    stripe.Refund.create(payment_intent=order.payment_intent_id)
-                    order.status = "cancelled"
-                    order.payment_status = "refunded"
-                    order.save()
-            except stripe.error.StripeError as e:
-                return  Response({'details':f'Stripe error: {str(e)}'},status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return Response({"message": "Order cancelled successfully. Your refund is being processed."},
+                            status=status.HTTP_202_ACCEPTED)
+        release_reservations(order)
         return Response({"message": "Order cancelled successfully"}, status=status.HTTP_200_OK)
 
 class Wishlist(viewsets.ModelViewSet):
@@ -383,46 +615,56 @@ class Wishlist(viewsets.ModelViewSet):
 
 class ApplyCouponView(APIView):
     def post(self, request):
-        code = request.data.get("code")
-        order_total = request.data.get("order_total")
-
+        serializer = CouponPreviewSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        code = serializer.validated_data["code"]
+        order_total = serializer.validated_data.get("order_total")
         try:
             coupon = Coupon.objects.get(code=code, is_active=True)
-            if not coupon.is_valid():
-                return Response({"error": "Coupon expired or invalid"}, status=status.HTTP_400_BAD_REQUEST)
-
-            if order_total < coupon.min_order_value:
-                return Response({"error": "Order total is too low for this coupon"}, status=status.HTTP_400_BAD_REQUEST)
-
-            discount = coupon.discount_value
-            if coupon.discount_type == "percent":
-                discount = (order_total * coupon.discount_value) / 100
-                if coupon.max_discount:
-                    discount = min(discount, coupon.max_discount)
-
-            discounted_total = max(order_total - discount, 0)
-
-            return Response(
-                {
-                    "message": "Coupon applied successfully",
-                    "discount": float(discount),
-                    "new_total": float(discounted_total),
-                },
-                status=status.HTTP_200_OK,
-            )
-
         except Coupon.DoesNotExist:
             return Response({"error": "Invalid coupon code"}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Preview against the given amount, or against the user's cart when none is sent.
+        if order_total is not None:
+            quote = price([], coupon, subtotal=order_total)
+        else:
+            quote = price(cart_lines(request.user), coupon)
+        if quote.errors:
+            return Response({"error": quote.errors[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            {
+                "message": "Coupon applied successfully",
+                "discount": float(quote.discount),
+                "new_total": float(quote.subtotal - quote.discount),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class QuoteBatchView(APIView):
+    """
+    Price up to 100 carts or coupon/carrier combinations in one call. A quote
+    without ``items`` prices the caller's cart.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = QuoteBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        quotes = quote_many(serializer.validated_data["quotes"], user=request.user)
+        return Response({"quotes": QuoteSerializer(quotes, many=True).data})
+
 
 class CouponViewSet(viewsets.ModelViewSet):
     queryset = Coupon.objects.all()
     serializer_class = CouponSerializer
     permission_classes = [IsAdminUser]  # Restrict access to admins
 
-class AvailableCouponsView(generics.ListAPIView):
+class AvailableCouponsView(CachedResponseMixin, generics.ListAPIView):
     queryset = Coupon.objects.filter(is_active=True)
     serializer_class = CouponSerializer
+    cache_namespace = COUPON_NAMESPACE
 
 class ShippingAddressViewSet(viewsets.ModelViewSet):
     serializer_class = ShippingAddressSerializer
@@ -459,10 +701,27 @@ class TrackOrderView(generics.RetrieveAPIView):
             order = self.get_queryset().get(id=order_id)
             if not order.tracking_number:
                 return Response({"message": "Tracking details not available yet."}, status=status.HTTP_400_BAD_REQUEST)
-            return Response(self.get_serializer(order).data)
+            etag = make_etag(request.user.pk, request.get_full_path(), order.updated_at)
+            not_modified = not_modified_response(request, etag, order.updated_at)
+            if not_modified is not None:
+                return not_modified
+            return set_validators(Response(self.get_serializer(order).data), etag, order.updated_at)
         except Order.DoesNotExist:
             return Response({"error": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
 
+class TrackingLookupView(APIView):
+    """Public lookup by tracking number for carriers and support tools, served from the tracking read model."""
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = "tracking"
+
+    def get(self, request, tracking_number):
+        record = tracking.lookup(tracking_number)
+        if record is None:
+            return Response({"error": "Tracking number not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(record)
+
 class UpdateOrderStatusView(generics.UpdateAPIView):
     serializer_class = UpdateOrderStatusSerializer
     permission_classes = [IsAdminUser]
@@ -471,24 +730,29 @@ class UpdateOrderStatusView(generics.UpdateAPIView):
         return Order.objects.all()
 
     def patch(self, request, order_id):
-        try:
-            order = self.get_queryset().get(id=order_id)
-            serializer = self.get_serializer(order, data=request.data, partial=True)
-            if serializer.is_valid():
-                serializer.save()
-                if serializer.data['status'] == "shipped":
-                    tracking_no = generate_custom_id()
-                    print(tracking_no)
-                    # tr = self.get_queryset().(tracking_number)
-                    order.tracking_number = tracking_no
-                    order.save()
-                return Response({"message": "Order status updated successfully."})
-
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        except Order.DoesNotExist:
-            return Response({"error": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+        result, = transition_orders([order_id], serializer.validated_data['status'])
+        if not result['ok']:
+            if 'status' not in result:
+                return Response({"error": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+            return Response({"error": result['error']}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"message": "Order status updated successfully.", **result})
+
+class BulkOrderStatusView(APIView):
+    """Move a batch of orders to one status; answers with a result per order."""
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer = BulkOrderStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = transition_orders(serializer.validated_data['order_ids'], serializer.validated_data['status'])
+        updated = sum(result['ok'] for result in results)
+        return Response({"updated": updated, "failed": len(results) - updated, "results": results})
 
-class ShippingCarrierViewset(viewsets.ModelViewSet):
+class ShippingCarrierViewset(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = ShippingCarrier.objects.all()
     serializer_class = ShippingCarrierSerializer
+    cache_namespace = SHIPPING_CARRIER_NAMESPACE
     permission_classes = [IsAuthenticated]
\ No newline at end of file
@@ -0,0 +1,174 @@
+import json
+import logging
+from datetime import timedelta
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Order, OrderItem, StripeEvent
+from .outbox import backoff
+from .reservations import commit_reservations, release_reservations
+from .tasks import process_stripe_event, refund_order, send_order_confirmation
+
+PENDING = "pending"
+PROCESSED = "processed"
+FAILED = "failed"
+
+LEASE_SECONDS = 60
+SIGNATURE_TOLERANCE = 300
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidEvent(Exception):
+    pass
+
+
+def get_max_attempts():
+    return getattr(settings, "STRIPE_EVENT_MAX_ATTEMPTS", 8)
+
+
+def record_event(payload, signature):
+    """
+    Verify a webhook delivery against ``STRIPE_WEBHOOK_SECRET``, store it and
+    queue a job to apply it. Redeliveries of an event id are ignored. Returns
+    ``(event, created)``; raises ``InvalidEvent`` for bad signatures or bodies.
+    """
+    secret = getattr(settings, "STRIPE_WEBHOOK_SECRET", "")
+    if not secret:
+        raise InvalidEvent("STRIPE_WEBHOOK_SECRET is not configured")
+    payload = payload.decode("utf-8") if isinstance(payload, bytes) else payload
+    try:
+        stripe.WebhookSignature.verify_header(payload, signature or "", secret, SIGNATURE_TOLERANCE)
+        data = json.loads(payload)
+        event_id, event_type = data["id"], data["type"]
+    except stripe.error.SignatureVerificationError as e:
+        raise InvalidEvent(str(e))
+    except (ValueError, KeyError, TypeError):
+        raise InvalidEvent("Malformed event payload")
+    with transaction.atomic():
+        event, created = StripeEvent.objects.get_or_create(event_id=event_id,
+                                                           defaults={"type": event_type, "payload": data})
+        if created:
+            process_stripe_event.enqueue(event_id=event.pk)
+    return event, created
+
+
+def _session_order(session):
+    order_id = (session.get("metadata") or {}).get("order_id")
+    if order_id:
+        return Order.objects.filter(pk=order_id).first()
+    return Order.objects.filter(session_id=session.get("id")).first()
+
+
+def mark_paid(order, payment_intent):
+    """
+    Record a confirmed payment and make the order's stock holds permanent.
+    An order cancelled before the payment landed stays cancelled and is
+    refunded instead. Safe to repeat.
+    """
+    now = timezone.now()
+    pending = Order.objects.filter(pk=order.pk, payment_status="pending")
+    with transaction.atomic():
+        if pending.filter(status="cancelled").update(payment_status="paid", payment_intent_id=payment_intent,
+                                                     updated_at=now):
+            refund_order.enqueue(order_id=order.pk)
+            return False
+        if not pending.exclude(status="cancelled").update(
+            payment_status="paid", status="processing", payment_intent_id=payment_intent, updated_at=now
+        ):
+            return False
+        OrderItem.objects.filter(order=order).update(payment_status=True)
+        commit_reservations(order)
+        send_order_confirmation.enqueue(order_id=order.pk)
+    return True
+
+
+def mark_unpaid(order):
+    """The session expired or an async payment failed: cancel the order and return its stock."""
+    if Order.objects.filter(pk=order.pk, payment_status="pending").exclude(status="cancelled").update(
+        payment_status="failed", status="cancelled", updated_at=timezone.now()
+    ):
+        release_reservations(order)
+        return True
+    return False
+
+
+def handle_session_completed(session):
+    order = _session_order(session)
+    if order is not None and session.get("payment_status") == "paid":
+        mark_paid(order, session.get("payment_intent"))
+
+
+def handle_session_async_succeeded(session):
+    order = _session_order(session)
+    if order is not None:
+        mark_paid(order, session.get("payment_intent"))
+
+
+def handle_session_unpaid(session):
+    order = _session_order(session)
+    if order is not None:
+        mark_unpaid(order)
+
+
+def handle_charge_refunded(charge):
+    if charge.get("refunded") and charge.get("payment_intent"):
+        Order.objects.filter(payment_intent_id=charge["payment_intent"]).exclude(payment_status="refunded").update(
+            payment_status="refunded", updated_at=timezone.now()
+        )
+
+
+HANDLERS = {
+    "checkout.session.completed": handle_session_completed,
+    "checkout.session.async_payment_succeeded": handle_session_async_succeeded,
+    "checkout.session.async_payment_failed": handle_session_unpaid,
+    "checkout.session.expired": handle_session_unpaid,
+    "charge.refunded": handle_charge_refunded,
+}
+
+
+def _claim(event_id):
+    now = timezone.now()
+    claimed = StripeEvent.objects.filter(pk=event_id, status=PENDING, available_at__lte=now).update(
+        available_at=now + timedelta(seconds=LEASE_SECONDS), attempts=F("attempts") + 1
+    )
+    return StripeEvent.objects.get(pk=event_id) if claimed else None
+
+
+def process_event(event_id):
+    """
+    Apply one stored event. Returns the event, or ``None`` when it is not
+    due or another worker holds it. Unknown event types are marked processed.
+    """
+    event = _claim(event_id)
+    if event is None:
+        return None
+    handler = HANDLERS.get(event.type)
+    try:
+        if handler is not None:
+            handler(event.payload["data"]["object"])
+    except Exception as e:
+        logger.exception("Stripe event %s failed", event.event_id)
+        if event.attempts >= get_max_attempts():
+            StripeEvent.objects.filter(pk=event.pk).update(status=FAILED, last_error=str(e))
+        else:
+            StripeEvent.objects.filter(pk=event.pk).update(
+                available_at=timezone.now() + backoff(event.attempts), last_error=str(e)
+            )
+        return event
+    StripeEvent.objects.filter(pk=event.pk).update(status=PROCESSED, last_error="", processed_at=timezone.now())
+    return event
+
+
+def process_due(limit=100):
+    """Apply up to ``limit`` due events in the order Stripe delivered them. Returns how many were attempted."""
+    due = StripeEvent.objects.filter(status=PENDING, available_at__lte=timezone.now()).order_by("received_at", "id")
+    attempted = 0
+    for event_id in due.values_list("pk", flat=True)[:limit]:
+        if process_event(event_id) is not None:
+            attempted += 1
+    return attempted
@@ -32,8 +32,8 @@ class PaymentStatusView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request, session_id):
-        try:
-            session = stripe.checkout.Session.retrieve(session_id)
-            return Response({"payment_status": session.payment_status}, status=200)
-        except Exception as e:
-            return Response({"error": str(e)}, status=400)
\ No newline at end of file
+        # Kept current by the Stripe webhook worker, so no call to Stripe here.
+        payment_status = Order.objects.filter(session_id=session_id).values_list("payment_status", flat=True).first()
+        if payment_status is None:
+            return Response({"error": "Order not found"}, status=404)
+        return Response({"payment_status": payment_status}, status=200)
\ No newline at end of file
@@ -1,9 +1,125 @@
-import random
-import string
+import os
+import socket
+import threading
 import time
+import zlib
+from datetime import datetime, timezone
+
+# IDs are <time><host><process><sequence> packed into one integer and written
+# as fixed-width Crockford base32, so they sort by creation time as strings.
+# The host and process id together are the node: unique among the live
+# processes of a deployment as long as every host (container) has its own
+# ID_GENERATOR_HOST, 0-1023. Deployments must set it; the hash of the hostname
+# used when it is missing is only for development, as a few dozen containers
+# (often all running as pid 1) are likely to share a hash.
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+TIME_BITS = 44
+HOST_BITS = 10
+PROCESS_BITS = 22
+SEQUENCE_BITS = 12
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+WIDTH = 18  # ceil(88 bits / 5)
+PREFIX = "ID"
+
+
+def configured_host():
+    """``ID_GENERATOR_HOST`` as an int, or ``None`` when it is not set."""
+    value = os.environ.get("ID_GENERATOR_HOST")
+    if not value:
+        return None
+    if not value.isdigit() or int(value) >= 1 << HOST_BITS:
+        raise ValueError(f"ID_GENERATOR_HOST must be an integer from 0 to {(1 << HOST_BITS) - 1}, not {value!r}")
+    return int(value)
+
+
+def default_host():
+    host = configured_host()
+    if host is None:
+        return zlib.crc32(socket.gethostname().encode()) % (1 << HOST_BITS)
+    return host
+
+
+# Two base32 digits per 10-bit chunk, so encoding is nine table lookups.
+_PAIRS = [ALPHABET[i >> 5] + ALPHABET[i & 31] for i in range(1024)]
+_SHIFTS = range(WIDTH * 5 - 10, -1, -10)
+
+
+def encode(value):
+    return PREFIX + "".join([_PAIRS[(value >> shift) & 1023] for shift in _SHIFTS])
+
+
+def decode(custom_id):
+    """``(created_at, host, process, sequence)`` of an ID from this module."""
+    value = 0
+    for char in custom_id[len(PREFIX):]:
+        value = value * 32 + ALPHABET.index(char)
+    sequence = value & MAX_SEQUENCE
+    value >>= SEQUENCE_BITS
+    process = value & ((1 << PROCESS_BITS) - 1)
+    value >>= PROCESS_BITS
+    host = value & ((1 << HOST_BITS) - 1)
+    created_at = datetime.fromtimestamp(((value >> HOST_BITS) + EPOCH_MS) / 1000, tz=timezone.utc)
+    return created_at, host, process, sequence
+
+
+class IdGenerator:
+    """
+    Thread-safe, per-process ID source. Up to 4096 IDs are issued per
+    millisecond; a larger burst or block borrows the following
+    milliseconds, and a clock that steps backwards keeps counting from the
+    last millisecond used, so IDs from one generator only ever increase.
+    """
+
+    def __init__(self, host=None, process=None):
+        self.pid = os.getpid()
+        self.host = default_host() if host is None else host
+        self.process = self.pid if process is None else process
+        self.node = (self.host << PROCESS_BITS) | (self.process & ((1 << PROCESS_BITS) - 1))
+        self.last_ms = -1
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def allocate(self, count):
+        """``count`` consecutive IDs as integers, reserved under one lock."""
+        ids = []
+        with self.lock:
+            now = int(time.time() * 1000) - EPOCH_MS
+            if now > self.last_ms:
+                self.last_ms, self.sequence = now, 0
+            while count:
+                if self.sequence > MAX_SEQUENCE:
+                    self.last_ms, self.sequence = self.last_ms + 1, 0
+                take = min(count, MAX_SEQUENCE + 1 - self.sequence)
+                base = (((self.last_ms << (HOST_BITS + PROCESS_BITS)) | self.node) << SEQUENCE_BITS) + self.sequence
+                ids.extend(range(base, base + take))
+                self.sequence += take
+                count -= take
+        return ids
+
+    def next_id(self):
+        return encode(self.allocate(1)[0])
+
+    def block(self, count):
+        return [encode(value) for value in self.allocate(count)]
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def get_generator():
+    """The process's generator; a forked child gets its own, keyed by its pid."""
+    global _generator
+    if _generator is None or _generator.pid != os.getpid():
+        with _generator_lock:
+            if _generator is None or _generator.pid != os.getpid():
+                _generator = IdGenerator()
+    return _generator
 
 def generate_custom_id():
-    timestamp = str(int(time.time()))
-    random_chars = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    return f"ID/{timestamp}/{random_chars}"
+    return get_generator().next_id()
 
+def generate_custom_ids(count):
+    """``count`` unique IDs allocated as one block, for a whole batch of orders."""
+    return get_generator().block(count)